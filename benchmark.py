@@ -0,0 +1,523 @@
+import time, sys, io, re, os, tempfile, datetime, tracemalloc, contextlib, subprocess
+import numpy, pandas
+import discuitstats, fakediscuit
+
+# Benchmarks for discuitstats. Run as "python benchmark.py"; nothing here
+# talks to discuit.org, the crawl benchmarks use a local fakediscuit server.
+
+##########################################################
+
+# the checks that found results differing where they have to be the same;
+# "python benchmark.py" exits non-zero if there are any, so a run can gate
+# changes
+mismatches = []
+
+# records a check of results that have to be the same, what naming them
+def check(same, what):
+  if not same:
+    print(f"  {what} differ!")
+    mismatches.append(what)
+
+# synthetic comment row, shaped like the ones processComments stores
+def fakeCommentRow(i):
+  return {
+    "Type": "Comment", "Disc": f"Disc{i % 50}", "Title": f"Post {i // 20}",
+    "User": f"user{i % 5000}", "PublicId": f"P{i // 20}", "IsBot": False,
+    "CreateDate": "20260524", "Upvotes": i % 7, "Downvotes": i % 3,
+    "PartialBot": False}
+
+# time record insertion in blocks of blockSize rows; per-row cost should
+# stay flat as the buffer grows, then time a rescan-style upsert of every
+# existing row and the final DataFrame build
+def benchRecordBuffer(totalRows = 200000, blockSize = 20000):
+  print(f"RecordBuffer: {totalRows} rows in blocks of {blockSize}")
+  records = discuitstats.RecordBuffer(discuitstats.rawDataColumns)
+  for blockStart in range(0, totalRows, blockSize):
+    start = time.perf_counter()
+    for i in range(blockStart, blockStart + blockSize):
+      records.upsert(f"P{i // 20}/c{i}", fakeCommentRow(i))
+    elapsed = time.perf_counter() - start
+    print(f"  rows {blockStart:>8}-{blockStart + blockSize:>8}: "
+          f"{10**6 * elapsed / blockSize:.2f} us/row")
+  start = time.perf_counter()
+  for i in range(totalRows):
+    records.upsert(f"P{i // 20}/c{i}", {"Upvotes": i % 11})
+  elapsed = time.perf_counter() - start
+  print(f"  rescan upsert of all rows: {10**6 * elapsed / totalRows:.2f} us/row")
+  start = time.perf_counter()
+  records.toDataFrame()
+  print(f"  toDataFrame: {time.perf_counter() - start:.2f} s")
+
+# synthetic rawData with plain string/object columns and comment bodies, as
+# generateTables returned it before the compact schema: numRows rows in posts of about
+# commentsPerPost comments each, dated around the default week
+def fakeRawData(numRows = 1000000, commentsPerPost = 20, seed = 0):
+  random = numpy.random.default_rng(seed)
+  numPosts = numRows // (commentsPerPost + 1)
+  postOf = numpy.concatenate([
+    numpy.arange(numPosts), random.integers(0, numPosts, numRows - numPosts)])
+  isPost = numpy.arange(numRows) < numPosts
+  postIds = pandas.Series(numpy.arange(numPosts)).astype(str).radd("P")
+  publicId = postIds.to_numpy()[postOf]
+  rowIds = numpy.where(
+    isPost, publicId,
+    publicId + "/c" + pandas.Series(numpy.arange(numRows)).astype(str).to_numpy())
+  postType = numpy.array(["Text", "Image", "Link"])[random.integers(0, 3, numPosts)]
+  users = pandas.Series(numpy.arange(20000)).astype(str).radd("user").to_numpy()
+  user = users[random.integers(0, len(users), numRows)]
+  user[random.random(numRows) < 0.01] = "ghost"
+  dates = numpy.array([f"202605{day:02}" for day in range(20, 32)])
+  postDate = dates[random.integers(0, len(dates), numPosts)]
+  return pandas.DataFrame({
+    "Type": numpy.where(isPost, postType[postOf], "Comment"),
+    "Disc": (pandas.Series(postOf % 300).astype(str).radd("Disc")).to_numpy(),
+    "Title": postIds.radd("Title of ").to_numpy()[postOf],
+    "User": user,
+    "PublicId": publicId,
+    "LastActivity": numpy.where(isPost, "2026-05-31T12:00:00Z", None),
+    "IsBot": random.random(numRows) < 0.02,
+    "CreateDate": numpy.where(
+      isPost, postDate[postOf % numPosts],
+      dates[random.integers(0, len(dates), numRows)]),
+    "Upvotes": random.integers(0, 20, numRows),
+    "Downvotes": random.integers(0, 10, numRows),
+    "CommentBody": numpy.where(isPost, None, "some comment text"),
+    "PartialBot": ~isPost & (random.random(numRows) < 0.01)},
+    index = rowIds)
+
+# time topXReport for each report variant, and the ReportEngine aggregation
+# pass plus the same variants, over a synthetic rawData
+def benchReport(numRows = 1000000):
+  print(f"Reports over {numRows} synthetic rawData rows")
+  rawData = discuitstats.compactRawData(
+    fakeRawData(numRows).drop(columns = "CommentBody"))
+  variants = [("Comments", 0), ("Comments", 50), ("Participants", 0), ("Participants", 50)]
+  reports = dict()
+  for rankVar, minVotePct in variants:
+    start = time.perf_counter()
+    reports[rankVar, minVotePct] = io.StringIO()
+    discuitstats.topXReport(
+      rawData, reports[rankVar, minVotePct], rankVar, minVotePct,
+      registeredAccounts = 0)
+    print(f"  topXReport {rankVar}/{minVotePct}: "
+          f"{time.perf_counter() - start:.2f} s")
+  start = time.perf_counter()
+  engine = discuitstats.ReportEngine(rawData)
+  engine.registeredAccounts = 0
+  print(f"  ReportEngine aggregation: {time.perf_counter() - start:.2f} s")
+  for rankVar, minVotePct in variants:
+    start = time.perf_counter()
+    report = io.StringIO()
+    engine.report(report, rankVar, minVotePct)
+    elapsed = time.perf_counter() - start
+    print(f"  ReportEngine {rankVar}/{minVotePct}: {elapsed:.2f} s")
+    # both report paths have to produce the same text
+    check(report.getvalue() == reports[rankVar, minVotePct].getvalue(),
+          f"ReportEngine and topXReport {rankVar}/{minVotePct} reports")
+
+# rawData memory with plain columns and with the compact schema, and the
+# time to convert one to the other
+def benchSchema(numRows = 1000000):
+  print(f"rawData schema over {numRows} synthetic rows")
+  rawData = fakeRawData(numRows)
+  print(f"  plain columns: {rawData.memory_usage(deep = True).sum() / 2**20:.0f} MiB")
+  start = time.perf_counter()
+  compact = discuitstats.compactRawData(rawData)
+  elapsed = time.perf_counter() - start
+  print(f"  compact schema: {compact.memory_usage(deep = True).sum() / 2**20:.0f} MiB "
+        f"(converted in {elapsed:.2f} s)")
+  compact = discuitstats.botRules.classify(compact)
+  print(f"  compact schema without CommentBody: "
+        f"{compact.memory_usage(deep = True).sum() / 2**20:.0f} MiB")
+
+# partial bot classification of every comment: compiling the user's
+# expression per comment as the crawl used to, with the precompiled
+# BotRules per comment as the crawl does now, and with BotRules.classify
+# over a whole rawData
+def benchBotRules(numRows = 1000000):
+  print(f"Bot classification of {numRows} synthetic rows")
+  rawData = fakeRawData(numRows)
+  rules = discuitstats.botRules
+  partialBots = discuitstats.partialBots
+  # a share of the comments come from partial bot users
+  partialBotUsers = list(partialBots)
+  users = rawData["User"].to_numpy(dtype = object)
+  users[::50] = partialBotUsers[0]
+  users[1::50] = partialBotUsers[-1]
+  rawData["User"] = users
+  bodies = rawData["CommentBody"].to_numpy(dtype = object)
+  bodies[::100] = "[BOT] some comment text"
+  rawData["CommentBody"] = bodies
+  comments = [
+    (user, body) for user, body in zip(users, bodies) if body is not None]
+
+  def isPartialBot(username, text):
+    if username not in partialBots:
+      return False
+    return re.compile(partialBots[username], re.I|re.S).search(text) is not None
+
+  start = time.perf_counter()
+  compiled = sum(isPartialBot(user, body) for user, body in comments)
+  print(f"  compile per comment: {time.perf_counter() - start:.2f} s")
+  start = time.perf_counter()
+  precompiled = sum(rules.isPartialBot(user, body) for user, body in comments)
+  print(f"  precompiled BotRules: {time.perf_counter() - start:.2f} s")
+  start = time.perf_counter()
+  vectorized = rules.classify(rawData)["PartialBot"].sum()
+  print(f"  BotRules.classify: {time.perf_counter() - start:.2f} s")
+  check(compiled == precompiled == vectorized,
+        f"partial bot counts {compiled}, {precompiled}, {vectorized}")
+
+# a year of weekly rawData saved to the Arrow archive and as the CSVs the
+# script exports: time to save it, to compute weeklyTrends from the
+# archive, and to just read the CSVs back
+def benchArchive(weeks = 52, rowsPerWeek = 100000):
+  print(f"Archive of {weeks} weeks of {rowsPerWeek} synthetic rows")
+  rawData = discuitstats.compactRawData(
+    fakeRawData(rowsPerWeek).drop(columns = "CommentBody"))
+  start = datetime.date(2025, 6, 1)
+  with tempfile.TemporaryDirectory() as directory:
+    archiveTime = csvTime = 0
+    for week in range(weeks):
+      weekFrom = start + datetime.timedelta(weeks = week)
+      discuitstats.fromDate = weekFrom.strftime("%Y%m%d")
+      discuitstats.toDate = (weekFrom + datetime.timedelta(days = 6)).strftime("%Y%m%d")
+      began = time.perf_counter()
+      discuitstats.archiveWeek(rawData, os.path.join(directory, "archive"))
+      archiveTime += time.perf_counter() - began
+      began = time.perf_counter()
+      rawData.drop(columns = ["Upvotes", "Downvotes"]).to_csv(
+        os.path.join(directory, f"week{week}.csv"), index_label = "index")
+      csvTime += time.perf_counter() - began
+    print(f"  save: archive {archiveTime:.2f} s, CSV {csvTime:.2f} s")
+    began = time.perf_counter()
+    discuitstats.weeklyTrends(os.path.join(directory, "archive"))
+    print(f"  weeklyTrends from archive: {time.perf_counter() - began:.2f} s")
+    began = time.perf_counter()
+    for week in range(weeks):
+      pandas.read_csv(os.path.join(directory, f"week{week}.csv"), index_col = "index",
+                      low_memory = False)
+    print(f"  reading the CSVs alone: {time.perf_counter() - began:.2f} s")
+
+# run f with discuitstats crawling a fresh fake server built from settings,
+# optionally tracing memory; returns f's result, the wall time, the peak
+# traced memory (or None) and the server's stats
+def againstFakeServer(f, settings, traced):
+  fake = fakediscuit.FakeDiscuitProcess(**settings)
+  discuitstats.baseURL = fake.start()
+  discuitstats.fromDate, discuitstats.toDate = "20260524", "20260531"
+  discuitstats.maxRequestsPerSecond = None
+  peak = None
+  try:
+    if traced:
+      tracemalloc.start()
+    start = time.perf_counter()
+    # the crawl's progress lines aren't part of the benchmark output
+    with contextlib.redirect_stdout(io.StringIO()):
+      result = f()
+    elapsed = time.perf_counter() - start
+    if traced:
+      peak = tracemalloc.get_traced_memory()[1]
+  finally:
+    if traced:
+      tracemalloc.stop()
+    stats = fake.stop()
+  return result, elapsed, peak, stats
+
+# generateTables and topXReport against a local fake Discuit server with
+# numPosts posts, latency seconds per response and a bump every bumpEvery
+# requests. Each is run once for the wall time and once more under
+# tracemalloc (which slows it down) for the peak memory.
+def benchCrawl(numPosts = 2000, latency = 0.002, bumpEvery = 200):
+  settings = {"numPosts": numPosts, "latency": latency, "bumpEvery": bumpEvery}
+  print(f"Crawl of a fake server: {settings}")
+  crawl = lambda: discuitstats.generateTables("")
+  discuitstats.metrics = discuitstats.CrawlMetrics()
+  rawData, elapsed, peak, stats = againstFakeServer(crawl, settings, False)
+  print(f"  generateTables: {elapsed:.2f} s, {stats['requests']} requests "
+        f"({stats['requests'] / elapsed:.0f}/s), "
+        f"{stats['bytes'] / 2**20 / elapsed:.1f} MiB/s, "
+        f"{len(rawData) / elapsed:.0f} rows/s, {stats['bumps']} bumps")
+  for endpoint, endpointMetrics in discuitstats.metrics.summary()["endpoints"].items():
+    print(f"    {endpoint}: {endpointMetrics['requests']} requests, "
+          f"{1000 * endpointMetrics['meanSeconds']:.1f} ms mean, "
+          f"{1000 * endpointMetrics['maxSeconds']:.1f} ms max")
+  rawData, elapsed, peak, stats = againstFakeServer(crawl, settings, True)
+  print(f"  generateTables peak memory: {peak / 2**20:.1f} MiB")
+  # the report only asks the server for the number of accounts
+  report = lambda: discuitstats.topXReport(rawData, io.StringIO())
+  result, elapsed, peak, stats = againstFakeServer(report, settings, False)
+  print(f"  topXReport: {elapsed:.2f} s over {len(rawData)} rows")
+  result, elapsed, peak, stats = againstFakeServer(report, settings, True)
+  print(f"  topXReport peak memory: {peak / 2**20:.1f} MiB")
+
+# the crawl of a fake server with latency seconds per response, over the
+# site-wide feed and sharded per community with each number of
+# shardWorkers; the sharded crawls have to collect the same rows
+def benchShards(numPosts = 1500, latency = 0.02, shardCounts = (2, 4, 8)):
+  settings = {"numPosts": numPosts, "latency": latency}
+  print(f"Site-wide vs sharded crawl of a fake server: {settings}")
+  crawl = lambda: discuitstats.generateTables("")
+  results = dict()
+  for shardWorkers in (0,) + tuple(shardCounts):
+    discuitstats.shardWorkers = shardWorkers
+    # the connection pool is sized for the number of shards
+    discuitstats.session = None
+    rawData, elapsed, peak, stats = againstFakeServer(crawl, settings, False)
+    results[shardWorkers] = rawData
+    print(f"  shardWorkers {shardWorkers}: {elapsed:.2f} s, "
+          f"{stats['requests']} requests")
+    check(rawData.index.sort_values().equals(results[0].index.sort_values()) and
+          rawData.loc[results[0].index].astype(str).equals(results[0].astype(str)),
+          f"shardWorkers {shardWorkers} rows")
+  discuitstats.shardWorkers = 0
+  discuitstats.session = None
+
+# an all-time crawl (fromDate = "") of a fake server, with the rows kept in
+# memory and reported by ReportEngine, and spilled to a SpillStore and
+# reported by StoreReport: wall time and traced peak memory of crawl plus
+# report, for numPosts and then twice as many. The spilled peak should stay
+# about the same as the window grows (SQLite's own page cache, a couple of
+# MiB, isn't traced); both have to report the same.
+def benchSpill(numPosts = 1000):
+  for posts in (numPosts, 2 * numPosts):
+    settings = {"numPosts": posts, "daysBefore": 60}
+    print(f"All-time crawl and report of a fake server: {settings}")
+    reports = dict()
+    with tempfile.TemporaryDirectory() as directory:
+      for spillFile in (None, os.path.join(directory, "rows.sqlite")):
+        discuitstats.spillFile = spillFile
+        def crawlAndReport():
+          discuitstats.fromDate = ""
+          records = discuitstats.crawlRecords("")
+          if spillFile:
+            engine = discuitstats.StoreReport(records)
+          else:
+            engine = discuitstats.ReportEngine(records.toDataFrame())
+          report = io.StringIO()
+          engine.report(report)
+          return len(records), report.getvalue()
+        untraced = againstFakeServer(crawlAndReport, settings, False)[1]
+        (rows, reports[spillFile]), elapsed, peak, stats = againstFakeServer(
+          crawlAndReport, settings, True)
+        print(f"  {'spilled' if spillFile else 'in memory'}: {rows} rows "
+              f"in {untraced:.2f} s untraced, {peak / 2**20:.1f} MiB peak")
+    check(len(set(reports.values())) == 1, "in-memory and spilled reports")
+  discuitstats.spillFile = None
+  discuitstats.fromDate = "20260524"
+
+# the crawl of a fake server with megathreads, long-lived threads with
+# comments from every week, through the full comment listing and through the
+# time-ordered one that stops at fromDate. Rows can only differ by comments
+# created before fromDate and edited in range, and the fake server edits
+# none, so both have to collect the same rows
+def benchCommentSort(numPosts = 1000, megathreads = 20, latency = 0.002):
+  settings = {"numPosts": numPosts, "megathreads": megathreads,
+              "megathreadComments": 2000, "daysBefore": 180, "latency": latency}
+  print(f"Crawl of a fake server with megathreads: {settings}")
+  rows = dict()
+  for commentSort in (None, "new"):
+    discuitstats.commentSort = commentSort
+    discuitstats.metrics = discuitstats.CrawlMetrics()
+    rawData, elapsed, peak, stats = againstFakeServer(
+      lambda: discuitstats.generateTables(""), settings, False)
+    rows[commentSort] = rawData
+    counters = discuitstats.metrics.summary()["counters"]
+    print(f"  {commentSort or 'full'} listing: {elapsed:.2f} s, "
+          f"{stats['requests']} requests, {stats['bytes'] / 2**20:.1f} MiB, "
+          f"{len(rawData)} rows, "
+          f"{counters.get('commentListingsCutOff', 0)} listings cut off, "
+          f"{counters.get('commentFetchesSkipped', 0)} fetches skipped")
+  discuitstats.commentSort = None
+  full, recent = rows[None], rows["new"]
+  print(f"  rows only in the full listing: {len(full.index.difference(recent.index))}, "
+        f"only in the time-ordered one: {len(recent.index.difference(full.index))}")
+  # the time-ordered listing yields a post's comments in another order
+  check(full.index.sort_values().equals(recent.index.sort_values()) and
+        recent.loc[full.index].astype(str).equals(full.astype(str)),
+        "full and time-ordered listing rows")
+
+# an all-time crawl of a fake server with daysBefore days of posts, rolled up
+# a week at a time as weekly crawls would, then the report variants over
+# every day from the DailyRollups, next to ReportEngine over the crawl's
+# rawData and the time the crawl took. Both have to print the same lines,
+# though posts tied in rank can be listed in another order (the rollups
+# hold posts in the order the weeks first saw them)
+def benchRollups(numPosts = 4000, daysBefore = 84):
+  settings = {"numPosts": numPosts, "daysBefore": daysBefore}
+  print(f"Daily rollups of a fake server: {settings}")
+  variants = [("Comments", 0), ("Comments", 50), ("Participants", 0), ("Participants", 50)]
+  def crawl():
+    discuitstats.fromDate = discuitstats.toDate = ""
+    return discuitstats.generateTables("")
+  rawData, elapsed, peak, stats = againstFakeServer(crawl, settings, False)
+  print(f"  all-time crawl: {elapsed:.2f} s, {len(rawData)} rows")
+  days = rawData["CreateDate"]
+  first = datetime.datetime.strptime(str(days.min()), "%Y%m%d")
+  weeks = []
+  while first.strftime("%Y%m%d") <= str(days.max()):
+    weeks.append((first.strftime("%Y%m%d"),
+                  (first + datetime.timedelta(days = 6)).strftime("%Y%m%d")))
+    first += datetime.timedelta(days = 7)
+  with tempfile.TemporaryDirectory() as directory:
+    rollups = discuitstats.DailyRollups(os.path.join(directory, "rollups.sqlite"))
+    began = time.perf_counter()
+    for weekFrom, weekTo in weeks:
+      # the posts a crawl of the week would have come across
+      weekPosts = rawData["PublicId"][days.between(int(weekFrom), int(weekTo))]
+      discuitstats.fromDate, discuitstats.toDate = weekFrom, weekTo
+      rollups.addRawData(rawData[rawData["PublicId"].isin(weekPosts)])
+    print(f"  roll up: {1000 * (time.perf_counter() - began) / len(weeks):.0f} ms "
+          f"per week over {len(weeks)} weeks, "
+          f"{rollups.db.execute('select count(*) from activity').fetchone()[0]} "
+          f"rollup rows")
+    discuitstats.fromDate, discuitstats.toDate = weeks[0][0], weeks[-1][1]
+    reports = []
+    for name, makeEngine in [
+        ("RollupReport", lambda: discuitstats.RollupReport(rollups)),
+        ("ReportEngine", lambda: discuitstats.ReportEngine(rawData))]:
+      began = time.perf_counter()
+      engine = makeEngine()
+      engine.registeredAccounts = 0
+      report = io.StringIO()
+      for rankVar, minVotePct in variants:
+        engine.report(report, rankVar, minVotePct)
+      reports.append(sorted(report.getvalue().splitlines()))
+      print(f"  {name}: {len(variants)} reports over {len(weeks)} weeks in "
+            f"{1000 * (time.perf_counter() - began):.0f} ms")
+    check(reports[0] == reports[1], "RollupReport and ReportEngine reports")
+  discuitstats.fromDate, discuitstats.toDate = "20260524", "20260531"
+
+# start-up: importing discuitstats alone (pandas is only imported on first
+# use) and with pandas, each in a fresh interpreter; then a cold run against
+# a fake server, and the same run again with the HTTP session and an
+# in-memory crawl store kept warm, as --daemon does between its runs
+def benchDaemon(numPosts = 1500, latency = 0.002):
+  print("Start-up")
+  for imports in ("discuitstats", "discuitstats, pandas"):
+    began = time.perf_counter()
+    subprocess.run(
+      [sys.executable, "-c", f"import {imports}"], check = True,
+      cwd = os.path.dirname(os.path.abspath(__file__)))
+    print(f"  import {imports}: {time.perf_counter() - began:.2f} s")
+  settings = {"numPosts": numPosts, "latency": latency}
+  print(f"Runs against a fake server: {settings}")
+  fake = fakediscuit.FakeDiscuitProcess(**settings)
+  discuitstats.Config(
+    baseURL = fake.start(), maxRequestsPerSecond = None, exportCSV = None,
+    reportFileName = None).apply()
+  discuitstats.crawlStore = discuitstats.CrawlStore(":memory:")
+  try:
+    for name in ("cold run", "warm run"):
+      discuitstats.metrics = discuitstats.CrawlMetrics()
+      began = time.perf_counter()
+      with contextlib.redirect_stdout(io.StringIO()):
+        discuitstats.run()
+      requests = sum(
+        endpoint["requests"] for endpoint in
+        discuitstats.metrics.summary()["endpoints"].values())
+      print(f"  {name}: {time.perf_counter() - began:.2f} s, {requests} requests")
+  finally:
+    fake.stop()
+    discuitstats.crawlStore.close()
+    discuitstats.crawlStore = None
+
+##########################################################
+
+# the crawl of a fake server bumping a post every bumpSeconds, with the
+# bumps only found by the rescan after the main crawl and with a bump
+# watcher polling every watchInterval seconds during it: wall time, the
+# rescan's share and the feed pages it read. Bumps only add comments after
+# toDate, so both have to collect the same rows as a crawl without bumps,
+# but for the LastActivity of the bumped posts.
+def benchBumpWatch(numPosts = 2000, latency = 0.002, bumpSeconds = 0.2,
+                   watchInterval = 1):
+  settings = {"numPosts": numPosts, "latency": latency}
+  print(f"Bump rescan vs bump watcher on a fake server: "
+        f"{dict(settings, bumpSeconds = bumpSeconds)}")
+  crawl = lambda: discuitstats.generateTables("")
+  discuitstats.metrics = discuitstats.CrawlMetrics()
+  baseline, elapsed, peak, stats = againstFakeServer(crawl, settings, False)
+  print(f"  no bumps: {elapsed:.2f} s, {stats['requests']} requests")
+  for interval in (None, watchInterval):
+    discuitstats.bumpWatchInterval = interval
+    discuitstats.metrics = discuitstats.CrawlMetrics()
+    rawData, elapsed, peak, stats = againstFakeServer(
+      crawl, dict(settings, bumpSeconds = bumpSeconds), False)
+    summary = discuitstats.metrics.summary()
+    counters, sections = summary["counters"], summary["sections"]
+    rescanSeconds = sum(
+      sections.get(section, {"seconds": 0})["seconds"]
+      for section in ("crawl.rescan", "crawl.redo"))
+    # the bumped posts' LastActivity moves, of course
+    columns = baseline.columns.drop("LastActivity")
+    name = f"watcher every {interval} s" if interval else "rescan only"
+    print(f"  {name}: "
+          f"{elapsed:.2f} s, {stats['requests']} requests, {stats['bumps']} bumps, "
+          f"rescan and redo {rescanSeconds:.2f} s, "
+          f"rescan {sum(summary['series'].get('rescanPassFeedPages', []))} feed pages "
+          f"in {len(summary['series'].get('rescanPassFeedPages', []))} passes, "
+          f"watcher {counters.get('bumpWatchPolls', 0)} polls and "
+          f"{counters.get('bumpWatchPages', 0)} pages")
+    check(rawData.index.sort_values().equals(baseline.index.sort_values()) and
+          rawData.loc[baseline.index, columns].astype(str).equals(
+            baseline[columns].astype(str)),
+          f"{name} and no bumps rows")
+  discuitstats.bumpWatchInterval = None
+
+# the crawl, with the time-ordered comment listing, of a fake server with
+# long threads and a bump every bumpEvery requests, with the rescan fetching
+# only the comments bumped posts gained (rescanDeltas) and with it fetching
+# their whole listing again down to fromDate: wall time, requests and the
+# redo phase's time. Both have to collect the same rows.
+def benchRescanDeltas(numPosts = 1000, maxComments = 200, latency = 0.002,
+                      bumpEvery = 100):
+  # every post in the window, so the bumped ones were all recorded
+  settings = {"numPosts": numPosts, "maxComments": maxComments,
+              "daysBefore": 0, "latency": latency, "bumpEvery": bumpEvery,
+              "maxBumps": 100}
+  print(f"Rescan with and without comment deltas on a fake server: {settings}")
+  crawl = lambda: discuitstats.generateTables("")
+  rescanDeltas = discuitstats.rescanDeltas
+  discuitstats.commentSort = "new"
+  results = dict()
+  try:
+    for name, deltas in [
+        ("whole listings", lambda posts, records: dict()),
+        ("deltas", rescanDeltas)]:
+      discuitstats.rescanDeltas = deltas
+      discuitstats.metrics = discuitstats.CrawlMetrics()
+      rawData, elapsed, peak, stats = againstFakeServer(crawl, settings, False)
+      results[name] = rawData
+      summary = discuitstats.metrics.summary()
+      print(f"  {name}: {elapsed:.2f} s, {stats['requests']} requests, "
+            f"{stats['bumps']} bumps, {summary['counters']['redoSetSize']} posts redone, "
+            f"redo {summary['sections']['crawl.redo']['seconds']:.2f} s, "
+            f"{summary['counters'].get('commentDeltaFetches', 0)} delta fetches")
+  finally:
+    discuitstats.rescanDeltas = rescanDeltas
+    discuitstats.commentSort = None
+  check(results["deltas"].astype(str).equals(results["whole listings"].astype(str)),
+        "rows with and without comment deltas")
+
+benchmarks = {
+  "records": benchRecordBuffer,
+  "report": benchReport,
+  "schema": benchSchema,
+  "bots": benchBotRules,
+  "archive": benchArchive,
+  "crawl": benchCrawl,
+  "shards": benchShards,
+  "spill": benchSpill,
+  "commentsort": benchCommentSort,
+  "rollups": benchRollups,
+  "daemon": benchDaemon,
+  "bumpwatch": benchBumpWatch,
+  "rescandeltas": benchRescanDeltas}
+
+if __name__ == "__main__":
+  # optionally pass benchmark names to run a subset
+  for name in sys.argv[1:] or benchmarks:
+    benchmarks[name]()
+  if mismatches:
+    sys.exit(f"Results differ: {', '.join(mismatches)}")
@@ -1,4 +1,21 @@
-import requests, time, pandas, datetime, sys, re
+import requests, time, datetime, sys, re, threading, json, sqlite3, os, importlib
+import concurrent.futures, requests.adapters, urllib3.util, cProfile
+
+# pandas (with numpy) is most of the start-up time and only the DataFrames
+# and reports need it, not the crawl, so both are imported on first use;
+# pandas in turn only imports tabulate when a table is printed
+class LazyModule:
+  def __init__(self, name):
+    self.name = name
+
+  def __getattr__(self, attribute):
+    module = importlib.import_module(self.name)
+    # later uses go straight to the module
+    globals()[self.name] = module
+    return getattr(module, attribute)
+
+pandas = LazyModule("pandas")
+numpy = LazyModule("numpy")
 
 # URL of the last report, to link back to it in the current report
 lastReportURL = "/DiscuitMeta/post/GjxcXGGN"
@@ -8,24 +25,40 @@ toDate = "20260531"
 
 reportFileName = None # "d:/docs/download/report_variations2.md" # if not None, will write reports to text file specified
 
-# if command line arguments provided, replace the last report URL and dates
-commandLineArgs = sys.argv
-if len(commandLineArgs) == 5:
-  cmdURL, cmdFrom, cmdTo, cmdReport = commandLineArgs[1:]
-  if cmdURL:
-    lastReportURL = cmdURL
-  if cmdFrom:
-    fromDate = cmdFrom
-  if cmdTo:
-    toDate = cmdTo
-  if cmdReport:
-    reportFileName = cmdReport
-
-exportCSV = f"d:/docs/download/DiscuitActivity_{fromDate}_{toDate}.csv"
+# "python discuitstats.py URL FROM TO REPORTFILE" replaces the last report
+# URL, dates and report file (blank arguments keep the settings above), and
+# any of these flags can be added (see parseCommandLine):
+#   --resume  continues an interrupted crawl from the checkpoint journal
+#             (see checkpointFile)
+#   --trends  prints the week-over-week trends of the weekly archive (see
+#             archiveDir) instead of crawling
+#   --range   writes the reports for fromDate-toDate from the daily rollups
+#             (see rollupFile) instead of crawling
+#   --daemon  stays resident and runs on a schedule (see daemonInterval)
+
+# CSV file the crawled rows are exported to, with {fromDate} and {toDate}
+# replaced by the dates of the run; None to not export
+exportCSV = "d:/docs/download/DiscuitActivity_{fromDate}_{toDate}.csv"
+# directory of the weekly archive: every run saves its rawData there as one
+# Arrow file per fromDate-toDate week, which --trends reads back without
+# crawling. Needs the pyarrow package. None to not archive
+archiveDir = None # "d:/docs/download/DiscuitArchive"
+# number of top discs listed per week in the trends
+trendTopDiscs = 3
+# SQLite file of daily rollups: every run replaces the fromDate-toDate days
+# in it with the per-post, per-disc and per-user activity of its crawl, and
+# --range reports any range of the days it holds (a month, a quarter...)
+# without crawling. None to not keep rollups
+rollupFile = None # "d:/docs/download/discuitrollups.sqlite"
 
 # summary tables show top X items
 topX = 10
 
+# (rankVar, minVotePct) of each report to write, one after the other;
+# rankVar is "Comments" or "Participants"
+reportVariants = [("Comments", 0)]
+# reportVariants = [("Comments", 0), ("Comments", 50), ("Participants", 0), ("Participants", 50)]
+
 # no point calculating stats for bots
 ignoredUsers = ["autotldr", "FlagWaverBot", "Betelgeuse", "catbot",
                 "alttextbot", "DiceBot", "PingBot", "pig_bot"]
@@ -33,13 +66,682 @@ ignoredUsers = ["autotldr", "FlagWaverBot", "Betelgeuse", "catbot",
 # for accounts partially controlled by bots and labelled
 # dict key is username; value is regular expression to filter comment body
 partialBots = {"ILostTheGame": r"^\[BOT\]", "AuralWanderer": r"^\[BOT\]"}
+# JSON file with "ignoredUsers" and/or "partialBots" entries shaped like the
+# two settings above, which it replaces; None to use the settings above
+botRulesFile = None # "d:/docs/download/discuitbots.json"
 
-# initial feed nextPage parameter--to be used in eventual resumption code
+# initial feed nextPage parameter
 nextPage = ""
 
+# journal of crawl checkpoints, so an interrupted crawl can be continued
+# with --resume; None to not checkpoint
+checkpointFile = None # "d:/docs/download/discuitcrawl.journal"
+# checkpoint after this many feed pages or rescan chunks
+checkpointEvery = 5
+
 baseURL = "https://discuit.org"
 #baseURL = "http://localhost:8080"
 
+# SQLite file the crawled rows are spilled to instead of being kept in
+# memory, for runs over long windows (e.g. fromDate = ""): the reports are
+# then aggregated from it by SQLite, so memory stays roughly flat however
+# many comments the window holds. The weekly archive isn't written for such
+# runs. None to keep the rows in memory
+spillFile = None # "d:/docs/download/discuitrows.sqlite"
+
+# SQLite file that keeps every crawled post's comments between runs; posts
+# whose lastActivityAt hasn't changed since are loaded from it instead of
+# being downloaded again. None to always download everything
+crawlStoreFile = None # "d:/docs/download/discuitcrawl.sqlite"
+
+# number of posts from a feed page whose comments are downloaded at once;
+# 1 downloads them one post at a time
+fetchWorkers = 4
+# sort parameter of a time-ordered, newest first, comment listing (e.g.
+# "new"): comments are then paged from it only until a page reaches back
+# before fromDate, instead of downloading every comment of every active
+# post. Comments created before fromDate but edited in range, which the full
+# listing would count, are missed past that page. The rescan likewise only
+# pages the listing of a bumped post the crawl already recorded down to its
+# recorded LastActivity. None for the full listing
+commentSort = None
+# sharded crawl: list the communities and walk each one's activity feed,
+# this many communities at once, instead of the single site-wide feed (the
+# rescan for bumped posts still reads the site-wide feed). 0 for the
+# site-wide feed
+shardWorkers = 0
+# seconds between polls of the top of the activity feed while the main
+# crawl runs, which add the posts bumped meanwhile to the redo set, so the
+# rescan after the crawl only has the last few bumps left to find. None to
+# only rescan after the main crawl
+bumpWatchInterval = None # 15
+# cap on API requests per second over all workers, None for no cap
+maxRequestsPerSecond = 5
+# seconds to wait for the server to accept a connection, and to respond
+requestTimeout = (10, 60)
+# times to retry a request that fails to connect or gets a 429/5xx response,
+# waiting exponentially longer between tries (or as long as Retry-After says)
+requestRetries = 6
+
+# JSON file the run's metrics (API requests per endpoint, feed pages, redo
+# set size, crawl and report timings) are written to; None to not write them
+metricsFile = None # "d:/docs/download/discuitmetrics.json"
+# cProfile output file for the run, readable with pstats or snakeviz; only
+# the main thread is profiled, not the comment fetch workers. None to not
+# profile
+profileFile = None # "d:/docs/download/discuitstats.prof"
+
+# --daemon redoes the run (crawl, exports, rollups and reports) every
+# daemonInterval seconds, keeping the HTTP connections and the crawl store
+# (in memory without a crawlStoreFile) between runs, so each run is a
+# refresh that only downloads the comments of posts active since the last
+daemonInterval = 3600
+# with daemonDays, each daemon run covers the daemonDays days up to the
+# current (UTC) day instead of fromDate-toDate
+daemonDays = None # 7
+
+##########################################################
+
+# Settings by name, for using discuitstats as a library: the settings above
+# stay module globals, read by every function, and a Config sets or
+# snapshots them as one object. Config(fromDate = "20260601").apply() sets
+# the given ones and redoes what was built from them (bot rules, HTTP
+# session, crawl store); Config.current() holds every setting's value.
+# Unknown names are an error rather than a new global.
+class Config(dict):
+  names = [
+    "lastReportURL", "fromDate", "toDate", "reportFileName", "exportCSV",
+    "archiveDir", "trendTopDiscs", "rollupFile", "topX", "reportVariants",
+    "ignoredUsers", "partialBots", "botRulesFile", "nextPage",
+    "checkpointFile", "checkpointEvery", "baseURL", "spillFile",
+    "crawlStoreFile", "fetchWorkers", "commentSort", "shardWorkers",
+    "bumpWatchInterval",
+    "maxRequestsPerSecond", "requestTimeout", "requestRetries",
+    "metricsFile", "profileFile", "daemonInterval", "daemonDays"]
+
+  def __init__(self, **settings):
+    unknown = set(settings) - set(self.names)
+    if unknown:
+      raise TypeError(f"Unknown settings: {', '.join(sorted(unknown))}")
+    super().__init__(settings)
+
+  @classmethod
+  def current(cls):
+    return cls(**{name: globals()[name] for name in cls.names})
+
+  def apply(self):
+    global botRules, session, crawlStore
+    globals().update(self)
+    if {"ignoredUsers", "partialBots", "botRulesFile"} & set(self):
+      botRules = loadBotRules()
+    if {"fetchWorkers", "shardWorkers", "requestRetries"} & set(self):
+      session = None
+    if "crawlStoreFile" in self and crawlStore:
+      crawlStore.close()
+      crawlStore = None
+
+# the settings and flags of a command line (without the script name): a
+# Config of the URL, dates and report file given, and the set of flags
+def parseCommandLine(args):
+  flags = {arg for arg in args if arg in ("--resume", "--trends", "--range", "--daemon")}
+  args = [arg for arg in args if arg not in flags]
+  settings = Config()
+  if len(args) == 4:
+    for name, value in zip(["lastReportURL", "fromDate", "toDate", "reportFileName"], args):
+      if value:
+        settings[name] = value
+  return settings, flags
+
+##########################################################
+
+# rawData columns: dtype of the finished DataFrame column, and the value
+# used when a row never had the column set (posts have no comment body, etc.).
+# "date" columns hold "YYYYMMDD" dates as integers and "timestamp" columns
+# hold parsed server datetimes, so date filters are integer comparisons;
+# the repetitive string columns are categoricals.
+rawDataColumns = {
+  "Type": ("category", None),
+  "Disc": ("category", None),
+  "Title": ("category", None),
+  "User": ("category", None),
+  "PublicId": ("category", None),
+  "LastActivity": ("timestamp", None),
+  "IsBot": ("bool", False),
+  "CreateDate": ("date", None),
+  "Upvotes": ("int32", 0),
+  "Downvotes": ("int32", 0),
+  "PartialBot": ("bool", False)}
+
+# convert a column's values (list or Series) to a rawDataColumns dtype
+def typedColumn(values, dtype):
+  values = pandas.Series(values)
+  if dtype == "date":
+    return values.astype("int32")
+  if dtype == "timestamp":
+    return pandas.to_datetime(values, utc = True, format = "ISO8601")
+  return values.astype(dtype)
+
+# rawData with the rawDataColumns dtypes, e.g. for data read back from an
+# exported CSV; already typed columns are left as they are
+def compactRawData(rawData):
+  rawData = rawData.copy()
+  for column, (dtype, default) in rawDataColumns.items():
+    if column not in rawData:
+      continue
+    typed = pandas.api.types.is_dtype_equal(rawData[column].dtype, dtype) or (
+      dtype == "date" and pandas.api.types.is_integer_dtype(rawData[column])) or (
+      dtype == "timestamp" and
+      pandas.api.types.is_datetime64_any_dtype(rawData[column]))
+    if not typed:
+      values = rawData[column]
+      if default is not None:
+        values = values.mask(values.isna(), default)
+      rawData[column] = typedColumn(values, dtype)
+  return rawData
+
+# Append-only columnar store for the crawl. Every post publicId or
+# "publicId/commentId" gets a fixed row number the first time it is seen,
+# and later upserts (e.g. from the rescan) overwrite that row in place, so
+# adding a row is O(1) no matter how large the crawl gets. The DataFrame
+# is built once from the column lists at the end. Values of the category
+# columns (users, discs, posts...) are interned to integer ids as they
+# arrive, which become the categorical codes of the finished DataFrame.
+# Only with trackChanges are the changed rows kept for takeChanges (the
+# checkpoint journal, merging shards); otherwise upserts don't record them.
+class RecordBuffer:
+  def __init__(self, columns, trackChanges = False):
+    self.columnSpec = columns
+    self.columns = {column: [] for column in columns}
+    self.rowOf = dict()
+    # rowId of each row, next to the columns
+    self.rowIds = []
+    # per category column: id of each value, and the values in id order
+    self.ids = {
+      column: dict() for column, (dtype, default) in columns.items()
+      if dtype == "category"}
+    self.categories = {column: [] for column in self.ids}
+    # rows upserted since the last takeChanges, None if not tracked
+    self.changedRows = set() if trackChanges else None
+
+  def __len__(self):
+    return len(self.rowOf)
+
+  def __contains__(self, rowId):
+    return rowId in self.rowOf
+
+  # set the given columns of a row, creating the row if needed; columns not
+  # given keep their previous value
+  def upsert(self, rowId, values):
+    row = self.rowOf.get(rowId)
+    if row is None:
+      row = len(self.rowOf)
+      self.rowOf[rowId] = row
+      self.rowIds.append(rowId)
+      for column in self.columns.values():
+        column.append(None)
+    for column, value in values.items():
+      if column in self.ids and value is not None:
+        value = self.intern(column, value)
+      self.columns[column][row] = value
+    if self.changedRows is not None:
+      self.changedRows.add(row)
+
+  def intern(self, column, value):
+    ids = self.ids[column]
+    valueId = ids.get(value)
+    if valueId is None:
+      valueId = ids[value] = len(ids)
+      self.categories[column].append(value)
+    return valueId
+
+  def value(self, column, row):
+    value = self.columns[column][row]
+    if column in self.ids and value is not None:
+      value = self.categories[column][value]
+    return value
+
+  # changed rows as [rowId, [value per column]] lists, for replaying with
+  # applyChanges; needs trackChanges
+  def takeChanges(self):
+    changes = [
+      [self.rowIds[row], [self.value(column, row) for column in self.columns]]
+      for row in sorted(self.changedRows)]
+    self.changedRows = set()
+    return changes
+
+  # nothing to release, unlike a SpillStore
+  def close(self, rollback = False):
+    pass
+
+  def applyChanges(self, changes):
+    for rowId, values in changes:
+      self.upsert(rowId, dict(zip(self.columns, values)))
+
+  # upsert the changed rows of shard, a RecordBuffer with trackChanges
+  def merge(self, shard):
+    self.applyChanges(shard.takeChanges())
+
+  def get(self, rowId, column):
+    return self.value(column, self.rowOf[rowId])
+
+  # number of post rows (comment rows have no LastActivity) whose raw
+  # LastActivity lies in low-high; the server's dates are fixed width, so
+  # they sort as strings
+  def countPostActivities(self, low, high):
+    return sum(
+      1 for activity in self.columns["LastActivity"]
+      if activity is not None and low <= activity <= high)
+
+  # latest raw LastActivity string over the post rows
+  def latestPostActivity(self):
+    activity = [date for date in self.columns["LastActivity"] if date is not None]
+    return max(activity) if activity else None
+
+  def toDataFrame(self):
+    data = dict()
+    for column, (dtype, default) in self.columnSpec.items():
+      values = self.columns[column]
+      if column in self.ids:
+        data[column] = pandas.Categorical.from_codes(
+          [-1 if value is None else value for value in values],
+          self.categories[column])
+        continue
+      if default is not None:
+        values = [default if value is None else value for value in values]
+      data[column] = typedColumn(values, dtype)
+    rawData = pandas.DataFrame(data)
+    rawData.index = self.rowIds
+    return rawData
+
+# Disk-backed stand-in for RecordBuffer: rows are upserted into a SQLite
+# table as they are collected, and SQLite only caches a few MiB of its
+# pages, so memory doesn't grow with the number of rows. Rows keep the order
+# they were first seen in, like RecordBuffer's. Changes are committed at
+# every checkpoint, so takeChanges has nothing left for the journal, and
+# resuming reopens the table with keep.
+class SpillStore:
+  sqlTypes = {
+    "category": "text", "str": "text", "timestamp": "text", "date": "integer",
+    "int32": "integer", "bool": "integer"}
+
+  def __init__(self, fileName, columns, keep = False):
+    self.fileName = fileName
+    self.columnSpec = columns
+    self.columns = list(columns)
+    self.db = sqlite3.connect(fileName)
+    if not keep:
+      self.db.execute("drop table if exists rows")
+    definitions = [
+      f'"{column}" {self.sqlTypes[dtype]}' +
+      ("" if default is None else f" default {int(default)}")
+      for column, (dtype, default) in columns.items()]
+    self.db.execute(f"""
+      create table if not exists rows (
+        row integer primary key,
+        rowId text unique not null,
+        {", ".join(definitions)})""")
+    # upsert statement per tuple of columns set
+    self.upserts = dict()
+
+  def __len__(self):
+    return self.db.execute("select count(*) from rows").fetchone()[0]
+
+  def __contains__(self, rowId):
+    return self.db.execute(
+      "select 1 from rows where rowId = ?", (rowId,)).fetchone() is not None
+
+  # set the given columns of a row, creating the row if needed; columns not
+  # given keep their previous value
+  def upsert(self, rowId, values):
+    columns = tuple(values)
+    statement = self.upserts.get(columns)
+    if statement is None:
+      names = self.columnList(columns)
+      updates = ", ".join(f'"{column}" = excluded."{column}"' for column in columns)
+      statement = self.upserts[columns] = (
+        f"insert into rows (rowId, {names}) values (?{', ?' * len(columns)}) "
+        f"on conflict (rowId) do update set {updates}")
+    self.db.execute(statement, (rowId, *values.values()))
+
+  def takeChanges(self):
+    self.db.commit()
+    return []
+
+  # the column names quoted for SQL, comma separated ("User" is a keyword)
+  @staticmethod
+  def columnList(columns):
+    return ", ".join(f'"{column}"' for column in columns)
+
+  def applyChanges(self, changes):
+    for rowId, values in changes:
+      self.upsert(rowId, dict(zip(self.columns, values)))
+
+  # upsert the rows of shard, a closed SpillStore, in their order, copying
+  # them within SQLite; its file is removed afterwards
+  def merge(self, shard):
+    self.db.commit()
+    self.db.execute("attach database ? as shard", (shard.fileName,))
+    names = self.columnList(self.columns)
+    updates = ", ".join(f'"{column}" = excluded."{column}"' for column in self.columns)
+    # "where true" keeps "on conflict" from parsing as a join constraint
+    self.db.execute(
+      f"insert into rows (rowId, {names}) select rowId, {names} from shard.rows "
+      f"where true order by row on conflict (rowId) do update set {updates}")
+    self.db.commit()
+    self.db.execute("detach database shard")
+    os.remove(shard.fileName)
+
+  def get(self, rowId, column):
+    return self.db.execute(
+      f'select "{column}" from rows where rowId = ?', (rowId,)).fetchone()[0]
+
+  def countPostActivities(self, low, high):
+    return self.db.execute(
+      "select count(*) from rows where LastActivity between ? and ?",
+      (low, high)).fetchone()[0]
+
+  def latestPostActivity(self):
+    return self.db.execute("select max(LastActivity) from rows").fetchone()[0]
+
+  def toDataFrame(self):
+    self.db.commit()
+    rawData = pandas.read_sql_query(
+      f"select rowId, {self.columnList(self.columns)} from rows order by row",
+      self.db, index_col = "rowId")
+    rawData.index.name = None
+    return compactRawData(rawData)
+
+  # write the rows, but for the excluded columns, to a CSV file a chunk at a
+  # time, like rawData.to_csv(fileName, index_label = "index")
+  def toCSV(self, fileName, exclude = ()):
+    self.db.commit()
+    columns = [column for column in self.columns if column not in exclude]
+    chunks = pandas.read_sql_query(
+      f'select rowId as "index", {self.columnList(columns)} from rows order by row',
+      self.db, index_col = "index", chunksize = 100000)
+    for i, chunk in enumerate(chunks):
+      chunk.to_csv(fileName, mode = "w" if i == 0 else "a", header = i == 0)
+
+  # rollback drops the rows upserted since the last takeChanges, as a crawl
+  # that failed has journaled none of them
+  def close(self, rollback = False):
+    if rollback:
+      self.db.rollback()
+    else:
+      self.db.commit()
+    self.db.close()
+
+# spaces API requests out so that no more than maxRequestsPerSecond start
+# in any second, however many threads are making them
+class RateLimiter:
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.nextSlot = 0.0
+
+  def wait(self):
+    if not maxRequestsPerSecond:
+      return
+    with self.lock:
+      now = time.monotonic()
+      slot = max(now, self.nextSlot)
+      self.nextSlot = slot + 1 / maxRequestsPerSecond
+    if slot > now:
+      time.sleep(slot - now)
+
+requestLimiter = RateLimiter()
+
+# Counters, timings and histograms of one run, safe to update from the
+# fetch workers. summary() is the JSON written to metricsFile.
+class CrawlMetrics:
+  # upper bounds, in seconds, of the request latency histogram buckets
+  latencyBuckets = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.endpoints = dict()
+    self.counters = dict()
+    self.series = dict()
+    self.sections = dict()
+
+  # API paths with the post publicId taken out, e.g. "/api/posts/{id}"
+  @staticmethod
+  def endpoint(path):
+    return re.sub(r"^/api/posts/[^/]+", "/api/posts/{id}", path)
+
+  def request(self, path, seconds, numBytes = 0, retries = 0, error = None):
+    with self.lock:
+      endpoint = self.endpoints.get(self.endpoint(path))
+      if endpoint is None:
+        endpoint = self.endpoints[self.endpoint(path)] = {
+          "requests": 0, "errors": dict(), "retries": 0, "bytes": 0,
+          "seconds": 0.0, "maxSeconds": 0.0,
+          "latency": [0] * (len(self.latencyBuckets) + 1)}
+      endpoint["requests"] += 1
+      endpoint["retries"] += retries
+      endpoint["bytes"] += numBytes
+      endpoint["seconds"] += seconds
+      endpoint["maxSeconds"] = max(endpoint["maxSeconds"], seconds)
+      bucket = 0
+      while bucket < len(self.latencyBuckets) and seconds > self.latencyBuckets[bucket]:
+        bucket += 1
+      endpoint["latency"][bucket] += 1
+      if error:
+        endpoint["errors"][error] = endpoint["errors"].get(error, 0) + 1
+
+  def count(self, name, amount = 1):
+    with self.lock:
+      self.counters[name] = self.counters.get(name, 0) + amount
+
+  def set(self, name, value):
+    with self.lock:
+      self.counters[name] = value
+
+  # add a value to a list, e.g. one per rescan pass
+  def append(self, name, value):
+    with self.lock:
+      self.series.setdefault(name, []).append(value)
+
+  def addTime(self, section, seconds):
+    with self.lock:
+      timing = self.sections.setdefault(section, {"calls": 0, "seconds": 0.0})
+      timing["calls"] += 1
+      timing["seconds"] += seconds
+
+  def stopwatch(self, prefix):
+    return Stopwatch(self, prefix)
+
+  def summary(self):
+    with self.lock:
+      endpoints = dict()
+      for name, endpoint in self.endpoints.items():
+        bounds = [str(bound) for bound in self.latencyBuckets] + ["more"]
+        endpoints[name] = dict(
+          endpoint, meanSeconds = endpoint["seconds"] / endpoint["requests"],
+          latency = dict(zip(bounds, endpoint["latency"])))
+      return {
+        "fromDate": fromDate, "toDate": toDate, "endpoints": endpoints,
+        "counters": dict(self.counters), "series": dict(self.series),
+        "sections": dict(self.sections)}
+
+  def save(self, fileName):
+    with open(fileName, "w") as metricsOutput:
+      json.dump(self.summary(), metricsOutput, indent = 2)
+
+# times consecutive sections of code: each lap(name) adds the time since
+# the previous lap (or since the stopwatch was made) to section
+# "prefix.name" of the metrics
+class Stopwatch:
+  def __init__(self, metrics, prefix):
+    self.metrics = metrics
+    self.prefix = prefix
+    self.start = time.perf_counter()
+
+  def lap(self, name):
+    now = time.perf_counter()
+    self.metrics.addTime(f"{self.prefix}.{name}", now - self.start)
+    self.start = now
+
+metrics = CrawlMetrics()
+
+# one pooled session shared by every API call, so connections (and their
+# TLS handshakes) are reused across the whole crawl
+session = None
+sessionLock = threading.Lock()
+
+def getSession():
+  global session
+  with sessionLock:
+    if session is None:
+      retry = urllib3.util.Retry(
+        total = requestRetries, backoff_factor = 0.5,
+        status_forcelist = (429, 500, 502, 503, 504),
+        allowed_methods = ["GET"], respect_retry_after_header = True)
+      # the pool needs a connection per fetch worker, plus the thread
+      # processing the feed, for each shard, and one for the bump watcher
+      adapter = requests.adapters.HTTPAdapter(
+        pool_maxsize = (fetchWorkers + 1) * max(1, shardWorkers) + 1,
+        max_retries = retry)
+      newSession = requests.Session()
+      newSession.mount("http://", adapter)
+      newSession.mount("https://", adapter)
+      newSession.headers.update({
+        "Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+      session = newSession
+    return session
+
+# GET an API path (e.g. "/api/posts") and return the decoded JSON
+def apiGet(path, params = None):
+  requestLimiter.wait()
+  start = time.perf_counter()
+  try:
+    response = getSession().get(
+      f"{baseURL}{path}", params = params, timeout = requestTimeout)
+    response.raise_for_status()
+  except requests.RequestException as error:
+    metrics.request(
+      path, time.perf_counter() - start, error = type(error).__name__)
+    raise
+  # urllib3 keeps the retries it made for this response
+  retries = getattr(response.raw, "retries", None)
+  metrics.request(
+    path, time.perf_counter() - start, len(response.content),
+    len(retries.history) if retries else 0)
+  return response.json()
+
+# Comments of crawled posts, keyed by post publicId and comment id, along
+# with the post's lastActivityAt when they were downloaded. Votes and
+# deletions don't bump a post's activity, so stored comments can have stale
+# vote counts until the post is active again.
+class CrawlStore:
+  def __init__(self, fileName):
+    # shards of a sharded crawl use the store from their own threads, one
+    # at a time
+    self.lock = threading.RLock()
+    self.db = sqlite3.connect(fileName, check_same_thread = False)
+    self.db.executescript("""
+      create table if not exists posts (
+        publicId text primary key,
+        lastActivityAt text not null);
+      create table if not exists comments (
+        publicId text not null,
+        commentId text not null,
+        position integer not null,
+        comment text not null,
+        primary key (publicId, commentId));""")
+
+  def hasCurrent(self, post):
+    with self.lock:
+      row = self.db.execute(
+        "select lastActivityAt from posts where publicId = ?",
+        (post["publicId"],)).fetchone()
+    return row is not None and row[0] == post["lastActivityAt"]
+
+  # the post's comments as a single page, or None if the store doesn't have
+  # them as of the post's current lastActivityAt
+  def getCommentPages(self, post):
+    with self.lock:
+      if not self.hasCurrent(post):
+        return None
+      comments = [json.loads(comment) for (comment,) in self.db.execute(
+        "select comment from comments where publicId = ? order by position",
+        (post["publicId"],))]
+    return [comments] if comments else []
+
+  def saveCommentPages(self, post, commentPages):
+    publicId = post["publicId"]
+    comments = [comment for page in commentPages for comment in page]
+    with self.lock:
+      self.db.execute("delete from comments where publicId = ?", (publicId,))
+      self.db.executemany(
+        "insert or replace into comments values (?, ?, ?, ?)",
+        [(publicId, comment["id"], position, json.dumps(comment))
+         for position, comment in enumerate(comments)])
+      self.db.execute(
+        "insert or replace into posts values (?, ?)",
+        (publicId, post["lastActivityAt"]))
+
+  def commit(self):
+    with self.lock:
+      self.db.commit()
+
+  def close(self):
+    self.db.close()
+
+# opened by generateTables when crawlStoreFile is set
+crawlStore = None
+
+# Append-only journal of crawl checkpoints. Each line holds the crawl state
+# (phase, feed cursor, rescan set...) and the rows changed since the previous
+# line, so writing a checkpoint costs only the new rows, and replaying every
+# line rebuilds the collected rows.
+class CrawlJournal:
+  def __init__(self, fileName):
+    self.fileName = fileName
+
+  def save(self, state, records):
+    line = json.dumps({
+      "fromDate": fromDate, "toDate": toDate, "columns": list(records.columns),
+      "spillFile": spillFile, "state": state, "rows": records.takeChanges()})
+    with open(self.fileName, "a") as journal:
+      journal.write(line + "\n")
+      journal.flush()
+      os.fsync(journal.fileno())
+
+  # latest state and records, rebuilt from the given empty records (or the
+  # reopened SpillStore, which only needs the state), or None if there is
+  # nothing to resume for the current date range
+  def load(self, records):
+    if not os.path.exists(self.fileName):
+      return None
+    state = None
+    with open(self.fileName) as journal:
+      for line in journal:
+        try:
+          checkpoint = json.loads(line)
+        except json.JSONDecodeError:
+          break # last line was cut off by the interruption
+        if (checkpoint["fromDate"], checkpoint["toDate"]) != (fromDate, toDate):
+          print(f"Checkpoint journal {self.fileName} is for a different "
+                "date range; not resuming")
+          return None
+        if checkpoint.get("columns") != list(records.columns):
+          print(f"Checkpoint journal {self.fileName} has different rawData "
+                "columns; not resuming")
+          return None
+        if checkpoint.get("spillFile") != spillFile:
+          print(f"Checkpoint journal {self.fileName} was written with a "
+                "different spillFile; not resuming")
+          return None
+        state = checkpoint["state"]
+        records.applyChanges(checkpoint["rows"])
+    if state is None:
+      return None
+    records.takeChanges() # already journaled
+    return state, records
+
+  def clear(self):
+    if os.path.exists(self.fileName):
+      os.remove(self.fileName)
 
 ##########################################################
 
@@ -71,16 +773,132 @@ def fetchFeed(feedNext, disc = None, sort = "activity"):
   args = {"sort": sort, "next": feedNext}
   if disc:
     args["communityId"] = disc
-  response = requests.get(rf"{baseURL}/api/posts", args)
-  json = response.json()
+  json = apiGet("/api/posts", args)
   return json["posts"], json["next"]
 
+# every community, as a list of community objects with "id" and "name"
+def fetchCommunities():
+  return apiGet("/api/communities")
+
 def getFullPost(post):
-  return requests.get(
-    f"{baseURL}/api/posts/{post['publicId']}").json()
+  return apiGet(f"/api/posts/{post['publicId']}")
+
+def fetchComments(publicId, commentsNext, sort = None):
+  args = {"next": commentsNext}
+  if sort:
+    args["sort"] = sort
+  comments = apiGet(f"/api/posts/{publicId}/comments", args)
+  return comments["comments"], comments["next"]
+
+# False if the post's metadata proves none of its comments can be in range:
+# it has none, or it was created after toDate, so they all were too
+def mayHaveCommentsInRange(post):
+  if not post["noComments"]:
+    return False
+  return not (toDate and dateFormat(post["createdAt"]) > toDate)
+
+# download a post's comments, as a list of comment lists; with since (see
+# rescanDeltas), only the ones from then on
+def fetchCommentPages(post, since = None):
+  if since:
+    return fetchNewCommentPages(post, since)
+  if commentSort:
+    return fetchRecentCommentPages(post)
+  # posts from home feed don't seem to contain comments
+  fullPost = getFullPost(post)
+  comments = fullPost["comments"]
+  commentsNext = fullPost["commentsNext"]
+  commentPages = []
+  while comments:
+    commentPages.append(comments)
+    if commentsNext:
+      comments, commentsNext = fetchComments(post["publicId"], commentsNext)
+    else:
+      break
+  return commentPages
+
+# the pages of the time-ordered comment listing (see commentSort), newest
+# first, down to the first one that reaches back before fromDate; skips the
+# full post fetch, as the feed already gave the post's metadata
+def fetchRecentCommentPages(post):
+  commentPages = []
+  commentsNext = ""
+  while True:
+    comments, commentsNext = fetchComments(
+      post["publicId"], commentsNext, commentSort)
+    if comments:
+      commentPages.append(comments)
+    if not comments or not commentsNext:
+      return commentPages
+    if fromDate and dateFormat(comments[-1]["createdAt"]) < fromDate:
+      metrics.count("commentListingsCutOff")
+      return commentPages
 
-def commentIsValid(comment, rawData, postCommentId):
-  if postCommentId in rawData.index:
+# the comments of a post the crawl recorded as of lastActivity (a raw server
+# date), which can only have gained comments created since: the pages of the
+# time-ordered listing down to the first comment created before then, cut
+# off there. The older ones were all seen when the post was recorded, so the
+# cost grows with the new comments, not with the thread.
+def fetchNewCommentPages(post, lastActivity):
+  since = serverDateToDT(lastActivity)
+  commentPages = []
+  commentsNext = ""
+  while True:
+    comments, commentsNext = fetchComments(
+      post["publicId"], commentsNext, commentSort)
+    newComments = [
+      comment for comment in comments
+      if serverDateToDT(comment["createdAt"]) >= since]
+    if newComments:
+      commentPages.append(newComments)
+    if len(newComments) < len(comments) or not commentsNext:
+      metrics.count("commentDeltaFetches")
+      return commentPages
+
+# For the rescan: the recorded LastActivity of the posts the crawl already
+# recorded, by publicId, so their comments are fetched from then on (see
+# fetchNewCommentPages). Looked up here, as the prefetching threads can't
+# read the records. Empty without a time-ordered listing to fetch from.
+def rescanDeltas(posts, records):
+  if not commentSort:
+    return dict()
+  return {
+    post["publicId"]: records.get(post["publicId"], "LastActivity")
+    for post in posts if post["publicId"] in records}
+
+# start downloading the comments of the posts processPosts will visit, with
+# up to fetchWorkers at once; returns futures keyed by publicId
+def prefetchComments(posts, pool, deltas):
+  futures = dict()
+  for post in posts:
+    if fromDate != "" and dateFormat(post["lastActivityAt"]) < fromDate:
+      break
+    if crawlStore and crawlStore.hasCurrent(post):
+      continue
+    if mayHaveCommentsInRange(post):
+      futures[post["publicId"]] = pool.submit(
+        fetchCommentPages, post, deltas.get(post["publicId"]))
+  return futures
+
+# a post's comments: from the crawl store if the post has had no activity
+# since they were stored, otherwise downloaded (or taken from the prefetch
+# futures) and saved to the store; see rescanDeltas for deltas
+def getCommentPages(post, commentFutures, deltas):
+  if crawlStore:
+    commentPages = crawlStore.getCommentPages(post)
+    if commentPages is not None:
+      return commentPages
+  if post["publicId"] in commentFutures:
+    commentPages = commentFutures[post["publicId"]].result()
+  else:
+    commentPages = fetchCommentPages(post, deltas.get(post["publicId"]))
+  # a time-ordered listing stops short, so is not the post's whole thread
+  if crawlStore and not commentSort:
+    crawlStore.saveCommentPages(post, commentPages)
+  return commentPages
+
+def commentIsValid(comment, records, postCommentId):
+  if postCommentId in records:
     return True
   if comment["deletedAt"]:
     return False
@@ -93,55 +911,95 @@ def commentIsValid(comment, rawData, postCommentId):
   return True
 
 
-# True/False: does given text match the username's regular expression match
-# flagging bot posts of a user partially under bot control
-def isPartialBot(username, text):
-  if username not in partialBots:
-    return False
-  if re.compile(partialBots[username], re.I|re.S).search(text):
-    return True
-  else:
-    return False
+# ignoredUsers and partialBots, with every partialBots expression compiled
+# once, so classifying a comment is a dict lookup plus, only for the few
+# partial bot users, one regex search. Comments are classified as they are
+# crawled and their bodies are not kept.
+class BotRules:
+  def __init__(self, ignoredUsers, partialBots):
+    self.ignoredUsers = set(ignoredUsers)
+    self.partialBots = {
+      username: re.compile(expression, re.I|re.S)
+      for username, expression in partialBots.items()}
 
+  # rules from a botRulesFile, falling back to the given settings for any
+  # entry the file leaves out
+  @classmethod
+  def load(cls, fileName, ignoredUsers, partialBots):
+    with open(fileName) as rulesFile:
+      rules = json.load(rulesFile)
+    return cls(
+      rules.get("ignoredUsers", ignoredUsers),
+      rules.get("partialBots", partialBots))
 
-def processComments(post, rawData, publicId, discName):
-  # posts from home feed don't seem to contain comments
-  fullPost = getFullPost(post)
-  comments = fullPost["comments"]
-  commentsNext = fullPost["commentsNext"]
+  def isBot(self, username):
+    return username in self.ignoredUsers
+
+  # True/False: does given text match the username's regular expression,
+  # flagging bot posts of a user partially under bot control
+  def isPartialBot(self, username, text):
+    expression = self.partialBots.get(username)
+    return expression is not None and expression.search(text) is not None
+
+  # rawData with IsBot and PartialBot recomputed from the comment bodies of
+  # an older crawl that still has its CommentBody column (e.g. read back
+  # from a CSV), and the bodies dropped; one vectorized pass per rule
+  def classify(self, rawData):
+    users, bodies = rawData["User"], rawData["CommentBody"]
+    rawData = rawData.drop(columns = "CommentBody")
+    rawData["IsBot"] = users.isin(self.ignoredUsers).to_numpy()
+    partialBot = numpy.zeros(len(rawData), dtype = bool)
+    for username, expression in self.partialBots.items():
+      rows = ((users == username) & bodies.notna()).to_numpy()
+      partialBot[rows] = bodies[rows].astype(str).str.contains(expression).astype(bool)
+    rawData["PartialBot"] = partialBot
+    return rawData
+
+# the BotRules of the current settings
+def loadBotRules():
+  if botRulesFile:
+    return BotRules.load(botRulesFile, ignoredUsers, partialBots)
+  return BotRules(ignoredUsers, partialBots)
+
+botRules = loadBotRules()
+
+
+# commentPages are the post's comments, from getCommentPages
+def processComments(post, records, publicId, discName, commentPages):
   anyCommentValid = False
-  while comments:
+  for comments in commentPages:
     for comment in comments:
       postCommentId = publicId + "/" + comment["id"]
-      if not commentIsValid(comment, rawData, postCommentId):
+      if not commentIsValid(comment, records, postCommentId):
         continue
       anyCommentValid = True
-      postCommentId = publicId + "/" + comment["id"]
-      if not postCommentId in rawData:
-        rawData.loc[
-          postCommentId,
-          ["Type", "Disc", "Title", "User", "PublicId", "IsBot", "CreateDate",
-           "Upvotes", "Downvotes", "CommentBody", "PartialBot"]] =\
-          ["Comment", discName, cleanTitle(post["title"].replace("\n", " ")),
-           comment["username"], publicId, comment["username"] in ignoredUsers,
-           dateFormat(comment["createdAt"]), comment["upvotes"],
-           comment["downvotes"], comment["body"],
-           isPartialBot(comment["username"], comment["body"])]
-    if commentsNext:
-      comments = requests.get(
-        f"{baseURL}/api/posts/{publicId}/comments",
-        {"next": commentsNext}).json()
-      comments, commentsNext = comments["comments"], comments["next"]
-    else:
-      break
+      records.upsert(postCommentId, {
+        "Type": "Comment", "Disc": discName,
+        "Title": cleanTitle(post["title"].replace("\n", " ")),
+        "User": comment["username"], "PublicId": publicId,
+        "IsBot": botRules.isBot(comment["username"]),
+        "CreateDate": dateFormat(comment["createdAt"]),
+        "Upvotes": comment["upvotes"], "Downvotes": comment["downvotes"],
+        "PartialBot": botRules.isPartialBot(comment["username"], comment["body"])})
   return anyCommentValid
 
 # A post can have dates that are out of range, but if its
 # comments are in the date range, they need to be counted.
 # So even in the primary scan, before the rescan, should examine the comments
 # in posts with last activity > toDate, because they could have been
-# bumped.
-def processPosts(posts, rawData, isRescan = False):
+# bumped. The rescan (isRescan) only fetches the comments recorded posts
+# gained since, where it can; see rescanDeltas.
+def processPosts(posts, records, isRescan = False):
+  deltas = rescanDeltas(posts, records) if isRescan else dict()
+  if fetchWorkers > 1:
+    # comments are downloaded concurrently, but still processed below in
+    # feed order, so the result is the same as a sequential run
+    with concurrent.futures.ThreadPoolExecutor(fetchWorkers) as pool:
+      return processPostsWith(
+        posts, records, prefetchComments(posts, pool, deltas), deltas)
+  return processPostsWith(posts, records, dict(), deltas)
+
+def processPostsWith(posts, records, commentFutures, deltas):
   reachedTimeLimit = False
   lastSuccessfulPostDate = ""
   for post in posts:
@@ -158,9 +1016,14 @@ def processPosts(posts, rawData, isRescan = False):
     if fromDate != "" and lastActivityAt < fromDate:
       reachedTimeLimit = True
       break
-    if post["noComments"]:
-      anyCommentValid = processComments(post, rawData, publicId, discName)
-    validPost = (anyCommentValid or validPostDate or publicId in rawData.index)
+    if publicId in commentFutures or mayHaveCommentsInRange(post):
+      commentPages = getCommentPages(post, commentFutures, deltas)
+      anyCommentValid = processComments(
+        post, records, publicId, discName, commentPages)
+    elif post["noComments"]:
+      # counted here, as prefetchComments asks mayHaveCommentsInRange too
+      metrics.count("commentFetchesSkipped")
+    validPost = (anyCommentValid or validPostDate or publicId in records)
     # needs to overwrite during rescan, to pick up the last activity time
     if validPost:
       username = post["username"]
@@ -169,13 +1032,61 @@ def processPosts(posts, rawData, isRescan = False):
       lastActivityRaw = post["lastActivityAt"]
       upvotes = post["upvotes"]
       downvotes = post["downvotes"]
-      rawData.loc[
-        publicId,
-        ["Type", "Disc", "Title", "User", "PublicId", "LastActivity", "IsBot", "CreateDate", "Upvotes", "Downvotes"]] =\
-        [postType, discName, title, username, publicId, lastActivityRaw, username in ignoredUsers, createdAt, upvotes, downvotes]
+      records.upsert(publicId, {
+        "Type": postType, "Disc": discName, "Title": title, "User": username,
+        "PublicId": publicId, "LastActivity": lastActivityRaw,
+        "IsBot": botRules.isBot(username), "CreateDate": createdAt,
+        "Upvotes": upvotes, "Downvotes": downvotes})
     lastSuccessfulPostDate = lastActivityAt
+  if crawlStore:
+    crawlStore.commit()
   return lastSuccessfulPostDate, reachedTimeLimit
 
+# One shard of a sharded crawl: a community's activity feed, walked down to
+# fromDate the same way as the site-wide feed, into records of its own
+# (RecordBuffer isn't thread-safe, nor is a SQLite connection shared across
+# threads). With spillFile, that is a SpillStore in fileName, closed once
+# the shard is done, so a shard waiting to be merged holds no rows in
+# memory. Posts belong to one community, so shards don't overlap.
+def crawlShard(community, fileName):
+  if spillFile:
+    records = SpillStore(fileName, rawDataColumns)
+  else:
+    records = RecordBuffer(rawDataColumns, trackChanges = True)
+  nextPage = ""
+  try:
+    while True:
+      print(f"Community {community['name']}: pagination parameter is: {nextPage}")
+      posts, nextPage = fetchFeed(nextPage, community["id"])
+      metrics.count("mainFeedPages")
+      lastPostDate, reachedTimeLimit = processPosts(posts or [], records)
+      if nextPage is None or reachedTimeLimit:
+        break
+  except BaseException:
+    records.close(rollback = True)
+    raise
+  records.close()
+  return records
+
+# main loop of a sharded crawl: every community's feed, shardWorkers at a
+# time, merged into records by row id (post publicId or
+# "publicId/commentId") in community order, so reruns build the same rows
+def crawlSharded(records):
+  communities = fetchCommunities()
+  print(f"Crawling the activity feeds of {len(communities)} communities, "
+        f"{shardWorkers} at once")
+  metrics.set("shards", len(communities))
+  fileNames = [f"{spillFile}.shard{i}" for i in range(len(communities))]
+  try:
+    with concurrent.futures.ThreadPoolExecutor(shardWorkers) as pool:
+      for shard in pool.map(crawlShard, communities, fileNames):
+        records.merge(shard)
+  finally:
+    # those of failed or unmerged shards
+    for fileName in fileNames:
+      if spillFile and os.path.exists(fileName):
+        os.remove(fileName)
+
 #####################################################################
 # Functions for rescanning activity feed after the main loop has completed.
 # Necessary because while doing the main loop, users could have bumped
@@ -183,7 +1094,7 @@ def processPosts(posts, rawData, isRescan = False):
 # as their activity has been resorted to the top of the feed.
 
 # helper function to update store of posts to rescan
-def updateRedos(publicIds, posts, rawData):
+def updateRedos(publicIds, posts, records):
   for post in posts:
     publicId = post["publicId"]
     activity = post["lastActivityAt"]
@@ -194,7 +1105,7 @@ def updateRedos(publicIds, posts, rawData):
       # if the post is in the redo set and its last activity is the same
       # as what has been seen in the rescanning so far, no need to update
       continue
-    if publicId in rawData.index and activity == rawData.loc[publicId]["LastActivity"]:
+    if publicId in records and activity == records.get(publicId, "LastActivity"):
       # if the current post last activity is equal to what was recorded
       # in the main loop, there is no change, so skip
       continue
@@ -203,100 +1114,315 @@ def updateRedos(publicIds, posts, rawData):
     # in the IDs to reexamine the comments
     publicIds[publicId] = post
 
-# rescan from the top of the activity feed to a given latest nanosecond pagination
-def rescan(latestDate, publicIds, rawData):
+# feed pages read by the bump rescan, and an estimate of the further pages
+# the previous rescan algorithm (re-reading each pass down to the prior
+# pass's top date, then one more pass to see the top unchanged) would have
+# read
+rescanStats = {"passes": 0, "pagesRead": 0, "pagesSaved": 0, "pageSize": 0}
+
+# the feed pages the previous algorithm would have read past the stop of a
+# pass at index stop of posts, a feed page, down to fullRescanBound (a raw
+# lastActivityAt): the posts whose latest known activity lies between there
+# and the stop, but for the rest of the page. That is the recorded one, or
+# for the posts of the redo set publicIds, the one they were bumped to.
+def estimatePagesSaved(posts, stop, publicIds, records, fullRescanBound):
+  stopDate = posts[stop]["lastActivityAt"]
+  below = records.countPostActivities(fullRescanBound, stopDate)
+  for publicId, post in publicIds.items():
+    if (publicId in records and
+        fullRescanBound <= records.get(publicId, "LastActivity") <= stopDate):
+      below -= 1
+    if fullRescanBound <= post["lastActivityAt"] <= stopDate:
+      below += 1
+  remaining = below - (len(posts) - stop)
+  pageSize = rescanStats["pageSize"]
+  return -(-remaining // pageSize) if remaining > 0 and pageSize else 0
+
+# whether a feed entry was already seen unchanged: recorded with its
+# lastActivityAt, in the redo set publicIds with it, or among the other
+# verified (publicId, lastActivityAt) entries, those neither holds. Answered
+# from the records, so the rescan doesn't hold every post's entry in memory.
+def isVerified(post, publicIds, records, verified):
+  publicId, activity = post["publicId"], post["lastActivityAt"]
+  if publicId in publicIds and publicIds[publicId]["lastActivityAt"] == activity:
+    return True
+  if publicId in records and records.get(publicId, "LastActivity") == activity:
+    return True
+  return (publicId, activity) in verified
+
+# One rescan pass: page down from the top of the activity feed, adding bumped
+# posts to the redo set, and stop at the first already verified entry (see
+# isVerified). The feed is sorted by activity, so anything below an entry
+# whose (publicId, lastActivityAt) was already seen unchanged has been
+# verified too, and each pass only reads the prefix bumped since the last
+# one. latestDate (pagination nanoseconds) bounds the pass if no verified
+# entry turns up. fullRescanBound is where the previous algorithm would have
+# stopped, for estimating the pages saved. Returns the number of new entries
+# seen, and the lastActivityAt at the top of the feed.
+def rescan(latestDate, publicIds, records, verified, fullRescanBound):
   nextPage = ""
-  firstIter = True
+  newEntries = 0
+  topDate = None
+  pagesRead = 0
   while True:
     print(f"Collecting bumped activity after main loop... nextPage = {nextPage} "
           f"with {len(publicIds)} posts in the rescan set")
     posts, nextPage = fetchFeed(nextPage)
-    if firstIter:
-      firstIter = False
-      if posts:
-        # save details of the top item of the feed for later, to determine
-        # if the item was already seen, and therefore nothing changed
-        # and we can stop looping
-        scanFirstDate = posts[0]["lastActivityAt"]
-        scanFirstPublicId = posts[0]["publicId"]
-      else:
-        scanFirstDate = None
-        scanFirstPublicId = None
-    updateRedos(publicIds, posts, rawData)
-    #time.sleep(2)
-    # stop loop if the pagination is earlier
-    if nextPage is None or int(nextPage) < latestDate:
-      break
-  return scanFirstPublicId, scanFirstDate
-
-def getRedoPosts(latestDate, rawData):
-  publicIds = dict()
-  prevDate = None
-  prevPublicId = None
-  firstIter = True
-  # if the first post in the current redo scan has the same id/last activity
-  # as the first post in the previous scan, then the feed has not changed
-  # and we're done rescanning
-  while True:
-    scanFirstPublicId, scanFirstDate = rescan(latestDate, publicIds, rawData)
-    latestDate = serverDateToNS(scanFirstDate)
-    if scanFirstDate is None:
-      break # this should mean the feed is empty
-    if firstIter:
-      firstIter = False
-    else:
-      # not the first iteration: check to see if the first item in the feed
-      # is unchanged--if so, done rescanning
-      if scanFirstPublicId == prevPublicId and scanFirstDate == prevDate:
+    rescanStats["pagesRead"] += 1
+    rescanStats["pageSize"] = max(rescanStats["pageSize"], len(posts))
+    pagesRead += 1
+    if topDate is None and posts:
+      topDate = posts[0]["lastActivityAt"]
+    stop = None
+    for i, post in enumerate(posts):
+      if isVerified(post, publicIds, records, verified):
+        stop = i
         break
-    prevPublicId = scanFirstPublicId
-    prevDate = scanFirstDate
+    newPosts = posts[:stop]
+    updateRedos(publicIds, newPosts, records)
+    # those updateRedos left out, as created after toDate
+    verified.update(
+      (post["publicId"], post["lastActivityAt"]) for post in newPosts
+      if not isVerified(post, publicIds, records, ()))
+    newEntries += len(newPosts)
+    # stop at a verified entry, or once the pagination is earlier
+    if stop is not None or nextPage is None or int(nextPage) < latestDate:
+      if stop is not None:
+        rescanStats["pagesSaved"] += estimatePagesSaved(
+          posts, stop, publicIds, records, fullRescanBound)
+      metrics.append("rescanPassFeedPages", pagesRead)
+      metrics.append("rescanPassNewEntries", newEntries)
+      return newEntries, topDate
+
+# publicIds and verified (entries verified besides the recorded and redo set
+# ones, see isVerified) can hold rescan state restored from a checkpoint;
+# checkpoint is called with the rescan state after every pass
+def getRedoPosts(latestDate, records, publicIds = None, verified = None,
+                 checkpoint = None):
+  if publicIds is None:
+    publicIds = dict()
+  if verified is None:
+    verified = set()
+  rescanStats.update(passes = 0, pagesRead = 0, pagesSaved = 0, pageSize = 0)
+  fullRescanBound = records.latestPostActivity()
+  # done once a pass finds nothing new at the top of the feed
+  while True:
+    rescanStats["passes"] += 1
+    newEntries, topDate = rescan(
+      latestDate, publicIds, records, verified, fullRescanBound)
+    if topDate is not None:
+      fullRescanBound = topDate
+    if checkpoint:
+      checkpoint({
+        "phase": "rescan", "latestDate": latestDate, "redoSet": publicIds,
+        "verified": sorted(verified)})
+    if not newEntries:
+      break
+  # the previous algorithm always needed a second pass, to see the top entry
+  # unchanged
+  if rescanStats["passes"] == 1:
+    rescanStats["pagesSaved"] += 1
+  print(f"Rescan read {rescanStats['pagesRead']} feed pages in "
+        f"{rescanStats['passes']} passes, saving about "
+        f"{rescanStats['pagesSaved']} pages over full rescans")
+  metrics.set("rescanPagesSaved", rescanStats["pagesSaved"])
   return list(publicIds.values())
 
+# Polls the top of the activity feed every bumpWatchInterval seconds from
+# its own thread while the main crawl runs, collecting the posts bumped
+# since watchFrom (pagination nanoseconds, the top of the feed when the
+# crawl started). Each poll reads down to the first entry an earlier poll
+# saw, like a rescan pass, so once the crawl is done, every entry it saw is
+# either in the redo set or recorded unchanged, and the rescan only has to
+# read the few pages bumped since the last poll. It doesn't touch the
+# records, which only the crawl's own thread may; see takeRedos.
+class BumpWatcher:
+  def __init__(self, watchFrom = None):
+    self.watchFrom = watchFrom
+    self.lock = threading.Lock()
+    self.seen = set()
+    self.posts = dict()
+    self.stopped = threading.Event()
+    self.thread = None
+
+  # starts polling; without a watchFrom, the current top of the feed is it
+  def start(self):
+    if self.watchFrom is None:
+      posts, _ = fetchFeed("")
+      self.watchFrom = serverDateToNS(posts[0]["lastActivityAt"]) if posts else 0
+    self.thread = threading.Thread(target = self.watch, daemon = True)
+    self.thread.start()
+
+  def watch(self):
+    while not self.stopped.wait(bumpWatchInterval):
+      try:
+        self.poll()
+      except requests.RequestException as error:
+        # the next poll, or the rescan, picks up where this one failed
+        print(f"Bump watcher poll failed: {error!r}")
+
+  # the entries are only marked seen once the poll is complete, so that a
+  # failed poll leaves no gap below them
+  def poll(self):
+    nextPage = ""
+    bumped = []
+    metrics.count("bumpWatchPolls")
+    while True:
+      posts, nextPage = fetchFeed(nextPage)
+      metrics.count("bumpWatchPages")
+      reachedSeen = False
+      for post in posts:
+        if ((post["publicId"], post["lastActivityAt"]) in self.seen or
+            serverDateToNS(post["lastActivityAt"]) <= self.watchFrom):
+          reachedSeen = True
+          break
+        bumped.append(post)
+      if reachedSeen or nextPage is None:
+        break
+    with self.lock:
+      for post in bumped:
+        self.seen.add((post["publicId"], post["lastActivityAt"]))
+        self.posts[post["publicId"]] = post
+
+  def stop(self):
+    self.stopped.set()
+    if self.thread:
+      self.thread.join()
+
+  # after stop: adds the bumped posts to the redo set publicIds (see
+  # updateRedos) and returns the entries seen, which the rescan can take as
+  # verified
+  def takeRedos(self, publicIds, records):
+    updateRedos(publicIds, list(self.posts.values()), records)
+    metrics.set("bumpWatchPosts", len(self.posts))
+    return set(self.seen)
+
 #####################################################################
 
-def generateTables(nextPage):
-  lastPostDate = ""
-  rawData = pandas.DataFrame({
-    "Type": pandas.Series(dtype = "str"),
-    "Disc": pandas.Series(dtype = "str"),
-    "Title": pandas.Series(dtype = "str"),
-    "User": pandas.Series(dtype = "str"),
-    "PublicId": pandas.Series(dtype = "str"),
-    "LastActivity": pandas.Series(dtype = "str"),
-    "IsBot": pandas.Series(dtype = "bool"),
-    "CreateDate": pandas.Series(dtype = "str"),
-    "Upvotes": pandas.Series(dtype = "int"),
-    "Downvotes": pandas.Series(dtype = "int"),
-    "CommentBody": pandas.Series(dtype = "str"),
-    "PartialBot": pandas.Series(dtype = "bool")})
+# empty records for a crawl: a RecordBuffer, or a SpillStore if spillFile is
+# set; keep reopens the SpillStore's rows for resuming, and trackChanges
+# has the RecordBuffer keep its changes for the checkpoint journal
+def newRecords(keep = False, trackChanges = False):
+  if spillFile:
+    return SpillStore(spillFile, rawDataColumns, keep)
+  return RecordBuffer(rawDataColumns, trackChanges)
 
-  while True:
-    print(f"Pagination parameter is: {nextPage}; last processed post date was: {lastPostDate}")
-    posts, nextPage = fetchFeed(nextPage)
-    lastPostDate, reachedTimeLimit = processPosts(
-      posts, rawData)
-    if nextPage is None or reachedTimeLimit:
-      break
-    #time.sleep(2)
+# the collected rawData as a DataFrame
+def generateTables(nextPage, resume = False):
+  records = crawlRecords(nextPage, resume)
+  start = time.perf_counter()
+  # the DataFrame is only built once, after all the upserts are done
+  rawData = records.toDataFrame()
+  metrics.addTime("crawl.toDataFrame", time.perf_counter() - start)
+  return rawData
+
+# with resume, continues from the last checkpoint in checkpointFile, if any;
+# returns the records (see newRecords) of the crawl
+def crawlRecords(nextPage, resume = False):
+  global crawlStore
+  if crawlStoreFile and crawlStore is None:
+    crawlStore = CrawlStore(crawlStoreFile)
+  journal = CrawlJournal(checkpointFile) if checkpointFile else None
+  state = {"phase": "main", "nextPage": nextPage, "lastPostDate": "", "watchFrom": None}
+  resumed = None
+  if journal and resume:
+    records = newRecords(keep = True, trackChanges = True)
+    resumed = journal.load(records)
+    if not resumed:
+      records.close(rollback = True)
+  if resumed:
+    state, records = resumed
+    print(f"Resuming crawl in the {state['phase']} phase with "
+          f"{len(records)} rows collected")
+  else:
+    if journal:
+      journal.clear()
+    records = newRecords(trackChanges = journal is not None)
+  try:
+    crawlPhases(state, records, journal)
+  except BaseException:
+    # leaves the spillFile unlocked for the next crawl
+    records.close(rollback = True)
+    raise
+  return records
+
+# the crawl from state on into records, checkpointed to the journal, if any
+def crawlPhases(state, records, journal):
+  def checkpoint(newState):
+    if journal:
+      journal.save(newState, records)
+
+  stopwatch = metrics.stopwatch("crawl")
+
+  watcher = None
+  if state["phase"] == "main" and bumpWatchInterval:
+    # a resumed crawl keeps watching from where it first started
+    watcher = BumpWatcher(state.get("watchFrom"))
+    watcher.start()
+  try:
+    if state["phase"] == "main" and shardWorkers:
+      # only checkpointed once every shard is done
+      crawlSharded(records)
+    elif state["phase"] == "main":
+      nextPage, lastPostDate = state["nextPage"], state["lastPostDate"]
+      pagesRead = 0
+      while True:
+        print(f"Pagination parameter is: {nextPage}; last processed post date was: {lastPostDate}")
+        posts, nextPage = fetchFeed(nextPage)
+        metrics.count("mainFeedPages")
+        lastPostDate, reachedTimeLimit = processPosts(
+          posts, records)
+        if nextPage is None or reachedTimeLimit:
+          break
+        pagesRead += 1
+        if pagesRead % checkpointEvery == 0:
+          checkpoint({
+            "phase": "main", "nextPage": nextPage, "lastPostDate": lastPostDate,
+            "watchFrom": watcher and watcher.watchFrom})
+  finally:
+    if watcher:
+      watcher.stop()
+  if state["phase"] == "main":
+    # need to check for posts that were bumped during looping
+    print("Relooping to search for posts that were bumped")
+    redoSet, verified = dict(), None
+    if watcher:
+      # the rescan starts from what the watcher already found
+      verified = sorted(watcher.takeRedos(redoSet, records))
+    state = {
+      "phase": "rescan",
+      "latestDate": serverDateToNS(records.latestPostActivity()),
+      "redoSet": redoSet, "verified": verified}
+    checkpoint(state)
+    stopwatch.lap("main")
+
+  if state["phase"] == "rescan":
+    verified = state["verified"]
+    if verified is not None:
+      verified = set(map(tuple, verified))
+    # get a list of posts to recheck
+    redoPosts = getRedoPosts(
+      state["latestDate"], records, state["redoSet"], verified, checkpoint)
+    state = {"phase": "redo", "redoPosts": redoPosts, "start": 0}
+    checkpoint(state)
+    stopwatch.lap("rescan")
 
-  # need to check for posts that were bumped during looping
-  print("Relooping to search for posts that were bumped")
-  latestDate = serverDateToNS(rawData.query("Type != 'Comment'")["LastActivity"].max())
-  # get a list of posts to recheck
-  redoPosts = getRedoPosts(latestDate, rawData)
   # process the rescans in chunks so as not to overwhelm the site
-  start = 0
+  redoPosts, start = state["redoPosts"], state["start"]
+  metrics.set("redoSetSize", len(redoPosts))
   while True:
     nextPosts = redoPosts[start:start + 10]
     if nextPosts:
-      processPosts(nextPosts, rawData, isRescan = True)
+      processPosts(nextPosts, records, isRescan = True)
       start += 10
+      if (start // 10) % checkpointEvery == 0:
+        checkpoint({"phase": "redo", "redoPosts": redoPosts, "start": start})
     else:
       break
-    #time.sleep(2)
-  rawData["PartialBot"] = rawData["PartialBot"].fillna(False)
-  return rawData
+  if journal:
+    journal.clear()
+  stopwatch.lap("redo")
+  metrics.set("rows", len(records))
 
 
 # !!! any point to separating this out as a function if comments/participants
@@ -318,70 +1444,35 @@ def generateTables(nextPage):
 
 
 
-# !!! filtering by vote percent requires the comment and participant count to be
-# recalculated
-# !!! test if bad comment accidentally removes post
-# test if bad post removes all comments
-# !!! counting OP as participant may not be valid since the post may be old
-# !!! test if op out of date range correctly counted in participants
-def topXReport(rawData, reportFile = None, rankVar = "Comments", minVotePct = 0, DiscuitURL = ""):
+def discRankVarFor(rankVar):
   if rankVar == "Comments":
-    discRankVar = "TotalEngagement"
+    return "TotalEngagement"
   elif rankVar == "Participants":
-    discRankVar = rankVar
+    return rankVar
   else:
     print("rankVar needs to be Comments or Participants to force the use "
           "of TotalEngagement or Participants in the disc rankings.")
     raise BaseException
 
-  # vote percent = 100 * upvotes / (upvotes + downvotes) and default to 100 if zero
-  # which can only happen if submitter undoes their auto vote
-  rawData = rawData.copy() # make a local copy instead of referencing original
-  # if a post is "bad," it and all its comments should be hidden
-  # if a comment is "bad," it's deleted but its post can stay if it is voted enough
-  rawData["VotePct"] = (100 * rawData["Upvotes"] / (rawData["Upvotes"] + rawData["Downvotes"])).fillna(100)
-  badPosts = rawData.query("(Type != 'Comment') & (VotePct < @minVotePct)")[["PublicId"]].drop_duplicates()
-  rawData = (
-    rawData.reset_index()
-    .merge(badPosts, on = "PublicId", how = "left", indicator = True)
-    .query("_merge == 'left_only'")
-    .drop(columns = "_merge")
-  )
-  rawData = rawData.query("(Type != 'Comment') | (VotePct >= @minVotePct)").set_index("index")
-  # grouping by post's publicId, comment count is total count minus 1 (the post)
-  rawData["Comments"] = (
-    rawData.groupby("PublicId")["Type"]
-      .transform(lambda x: pandas.Series.count(x) - 1))
-  # participants is unique users including OP, but need to filter for dates
-  # create a fake name column to null out-of-date-range users
-  rawData["FakeName"] = rawData["User"]
-  rawData.loc[
-    ~(
-      (fromDate <= rawData["CreateDate"]) &
-      ((rawData["CreateDate"] <= toDate) | (toDate == ""))),
-    "FakeName"
-  ] = None
-  rawData["Participants"] = (
-    rawData.groupby("PublicId")["FakeName"]
-      .transform(
-        lambda x: pandas.Series.nunique(x)))
-  rawData.drop(columns = "FakeName", inplace = True)
-
-  contentTypes = ["Texts", "Images", "Links", "Comments"]
-  nonBot = rawData[~rawData["IsBot"].astype(bool) &
-                   ~rawData["PartialBot"].astype(bool)]
-  # comments in the dataframe should all be within the date range already
-  sumPostComments = len(
-    nonBot.query("(Type == 'Comment') & (@fromDate <= CreateDate) & "
-                 "((CreateDate <= @toDate) | (@toDate == ''))"))
-  numDiscs = len(nonBot['Disc'].unique())
-  activeUsers = len(
-    nonBot
-    .query("(@fromDate <= CreateDate) & ((CreateDate <= @toDate) | (@toDate == ''))")['User']
-    .unique())
-  # includes posts that are not inside the date range, if a comment was made in range
-  activePosts = len(nonBot['PublicId'].unique())
+reportContentTypes = ["Texts", "Images", "Links", "Comments"]
+
+# categorical Type column with the names pluralized ("Text" -> "Texts")
+def pluralTypes(types):
+  return types.cat.rename_categories(lambda postType: postType + "s")
+
+# mask of the integer YYYYMMDD dates between fromDate and toDate, or the
+# (from, to) of dateRange; a blank from or to leaves that end of the range open
+def inDateRange(dates, dateRange = None):
+  rangeFrom, rangeTo = dateRange or (fromDate, toDate)
+  return (
+    (dates >= int(rangeFrom or 0)) & (dates <= int(rangeTo or 99999999)))
+
+def getRegisteredAccounts():
+  return apiGet("/api/_initial")["noUsers"]
 
+def printReportHeader(reportFile, rankVar, minVotePct, activeUsers,
+                      activePosts, sumPostComments, numDiscs,
+                      registeredAccounts):
   print(f"\n# rankVar = {rankVar}, minVotePct = {minVotePct}\n", file = reportFile)
 
   print(f"\nDiscuit week in review: {fromDate}-{toDate}\n", file = reportFile)
@@ -391,8 +1482,6 @@ def topXReport(rawData, reportFile = None, rankVar = "Comments", minVotePct = 0,
   print("\nDiscuit API is [documented here](https://docs.discuit.org/getting-started). "
         "Source code of script generating the tables is "
         "[available here](https://github.com/reallytiredofclowns/discuitstats).", file = reportFile)
-  registeredAccounts = requests.get(
-    f"{baseURL}/api/_initial").json()["noUsers"]
   print(f"\n{activeUsers} users discussed {activePosts} posts in "
         f"{sumPostComments} comments over {numDiscs} total discs. "
         f"At the time of this report, there were {registeredAccounts} accounts.\n", file = reportFile)
@@ -401,74 +1490,44 @@ def topXReport(rawData, reportFile = None, rankVar = "Comments", minVotePct = 0,
         "asyoucanseE_ [has alternative charting](https://sheet.zohopublic.eu/sheet/published/gr2z56fe0a19d6468429b9d88b3e60c81b23b).\n",
         file = reportFile)
 
-  postTypes = rawData["Type"][rawData["Type"] != 'Comment'].unique()
-  postTypes.sort()
-  for postType in postTypes:
-    subset = (rawData.query("Type == @postType")
-      .drop(columns = ["Type", "PublicId"]).copy())
-    if len(subset):
-      # this really should be moved to the data capture section... or not? that would write escapes to CSV
-      subset["User"] = subset["User"].str.replace("_", "\\_")
-      subset["Rank"] = subset[rankVar].rank(method = "min", ascending = False)
-      subset = subset.query("Rank <= @topX")
-      subset = subset.sort_values("Rank")
-      # if Title is all whitespace, print a fake string of &nbsp; so the
-      # anchor isn't broken
-      allBlank = ~subset["Title"].str.fullmatch(r"^.*[^\s].*$")
-      subset.loc[allBlank, "Title"] = "&nbsp;" * 10
-      subset["Title"] = (
-        "[" + subset['Title'] + f"]({DiscuitURL}/" + subset['Disc'] +
-        "/post/" + subset.index + ")")
-      subset = subset[["Rank", "Disc", "Title", "User", rankVar]]
-      print(f"## Top {topX} most engaging {postType}s:", file = reportFile)
-      print(subset.to_markdown(index = False), file = reportFile)
-      print("\n\n", file = reportFile)
-
-  # # top comment, by votes, filtered
-  # subset = rawData.query("(Type == 'Comment') & (VotePct >= @minVotePct)").copy()
-  # subset["Rank"] = subset["Upvotes"].rank(method = "min", ascending = False)
-  # subset = subset.query("Rank <= @topX")
-  # subset = subset.sort_values("Rank")
-  # # restrict comment link text to 100 chars
-  # subset["CommentBody"] = subset["CommentBody"].str.replace("\n", " ")
-  # subset.loc[
-  #   subset["CommentBody"].str.len() > 100,
-  #   "CommentBody"
-  # ] = subset["CommentBody"].str.slice(0, 100) + "..."
-
-  # subset["CommentBody"] = (
-  #   "[" + subset["CommentBody"] + f"]({DiscuitURL}/" + subset['Disc'] +
-  #   "/post/" + subset.index + ")")
-  # subset = subset[["Rank", "Disc", "CommentBody", "User", "Upvotes"]]
-  # print(f"## Top {topX} most upvoted comments:", file = reportFile)
-  # print(subset.to_markdown(index = False), file = reportFile)
-  # print("\n\n", file = reportFile)
+# subset: the post rows of postType, indexed by publicId, with Disc, Title,
+# User and rankVar columns
+def printPostTable(subset, postType, reportFile, rankVar, DiscuitURL):
+  if len(subset):
+    subset["Rank"] = subset[rankVar].rank(method = "min", ascending = False)
+    subset = subset.query("Rank <= @topX")
+    subset = subset.sort_values("Rank")
+    subset = subset.astype({"Disc": str, "Title": str, "User": str})
+    # this really should be moved to the data capture section... or not? that would write escapes to CSV
+    subset["User"] = subset["User"].str.replace("_", "\\_")
+    # if Title is all whitespace, print a fake string of &nbsp; so the
+    # anchor isn't broken
+    allBlank = ~subset["Title"].str.fullmatch(r"^.*[^\s].*$")
+    subset.loc[allBlank, "Title"] = "&nbsp;" * 10
+    subset["Title"] = (
+      "[" + subset['Title'] + f"]({DiscuitURL}/" + subset['Disc'] +
+      "/post/" + subset.index + ")")
+    subset = subset[["Rank", "Disc", "Title", "User", rankVar]]
+    print(f"## Top {topX} most engaging {postType}s:", file = reportFile)
+    print(subset.to_markdown(index = False), file = reportFile)
+    print("\n\n", file = reportFile)
 
-
-  # disc activity
-  subset = nonBot.copy()
-  # don't count posts created out-of-date-range (could have been included
-  # due to comments being in date range)... comments should already be in range
-  deletes = subset[
-    (
-      (subset["CreateDate"] > toDate) |
-      ((fromDate != "") & (subset["CreateDate"] < fromDate))
-    )
-  ].index
-  subset = subset.drop(index = deletes)
-  subset["Type"] = subset["Type"] + "s"
-
-  # need to recalculate participants here at disc level, not post
-  participants = (
-    subset.groupby("Disc", as_index = False)["User"].nunique()
-    .rename(columns = {"User": "Participants"}))
-  subset = (subset.groupby(["Disc", "Type"], as_index = False)
-    .size().pivot(columns = "Type", index = "Disc", values = "size"))
+# typeCounts: Disc, Type ("Texts", "Comments"...) and size columns;
+# participants: Disc and Participants columns
+def printDiscTable(typeCounts, participants, reportFile, discRankVar, DiscuitURL):
+  typeCounts = typeCounts.astype({"Disc": str, "Type": str})
+  participants = participants.astype({"Disc": str})
+  subset = typeCounts.pivot(columns = "Type", index = "Disc", values = "size")
   subset = (
     subset.merge(participants, how = "left", on = "Disc")
     .reset_index().fillna(0))
+  printDiscRanking(subset, reportFile, discRankVar, DiscuitURL)
+
+# subset: a row per disc with Disc, Participants and per-type count
+# columns; has to hold at least the discs ranked topX or better, in Disc order
+def printDiscRanking(subset, reportFile, discRankVar, DiscuitURL):
   # if none of a post type/comment, need to create a zeroed column so it exists
-  for contentType in contentTypes:
+  for contentType in reportContentTypes:
     if contentType not in subset:
       subset[contentType] = 0
   subset["TotalPosts"] = subset["Texts"] + subset["Images"] + subset["Links"]
@@ -482,24 +1541,20 @@ def topXReport(rawData, reportFile = None, rankVar = "Comments", minVotePct = 0,
   print(subset.to_markdown(index = False), file = reportFile)
   print("\n", file = reportFile)
 
-  # user activity--remove Ghost and bot users from the active users table
-  subset = nonBot.query("(User != 'ghost') & ~IsBot & ~PartialBot").copy()
-  deletes = subset[
-    (subset["Type"] != "Comment") &
-    (
-      (subset["CreateDate"] > toDate) |
-      ((fromDate != "") & (subset["CreateDate"] < fromDate))
-    )
-  ].index
-  subset = subset.drop(index = deletes)
-  subset["Type"] = subset["Type"] + "s"
-  subset = (subset.groupby(["User", "Type"], as_index = False)
-    .size()
+# typeCounts: User, Type and size columns
+def printUserTable(typeCounts, reportFile, DiscuitURL):
+  typeCounts = typeCounts.astype({"User": str, "Type": str})
+  subset = (typeCounts
     .pivot(columns = "Type", index = "User", values = "size")
     .reset_index()
     .fillna(0))
+  printUserRanking(subset, reportFile, DiscuitURL)
+
+# subset: a row per user with User and per-type count columns; has to hold
+# at least the users ranked topX or better, in User order
+def printUserRanking(subset, reportFile, DiscuitURL):
   # if none of a post type/comment, need to create a zeroed column so it exists
-  for content in contentTypes:
+  for content in reportContentTypes:
     if content not in subset:
       subset[content] = 0
   subset["TotalPosts"] = subset["Texts"] + subset["Images"] + subset["Links"]
@@ -513,20 +1568,778 @@ def topXReport(rawData, reportFile = None, rankVar = "Comments", minVotePct = 0,
   print(f"## Top {topX} most engaged Discuiteers:", file = reportFile)
   print(subset.to_markdown(index = False), file = reportFile)
 
+# !!! filtering by vote percent requires the comment and participant count to be
+# recalculated
+# !!! test if bad comment accidentally removes post
+# test if bad post removes all comments
+# !!! counting OP as participant may not be valid since the post may be old
+# !!! test if op out of date range correctly counted in participants
+# registeredAccounts is fetched from the site if not given
+def topXReport(rawData, reportFile = None, rankVar = "Comments", minVotePct = 0, DiscuitURL = "",
+               registeredAccounts = None):
+  discRankVar = discRankVarFor(rankVar)
+  stopwatch = metrics.stopwatch("topXReport")
+
+  # vote percent = 100 * upvotes / (upvotes + downvotes) and default to 100 if zero
+  # which can only happen if submitter undoes their auto vote
+  votePct = (100 * rawData["Upvotes"] / (rawData["Upvotes"] + rawData["Downvotes"])).fillna(100)
+  isComment = rawData["Type"] == "Comment"
+  # if a post is "bad," it and all its comments should be hidden
+  # if a comment is "bad," it's deleted but its post can stay if it is voted enough
+  badPosts = rawData["PublicId"][~isComment & (votePct < minVotePct)]
+  rawData = rawData[
+    ~rawData["PublicId"].isin(badPosts) &
+    (~isComment | (votePct >= minVotePct))].copy()
+  isComment = rawData["Type"] == "Comment"
+  # grouping by post's publicId, comment count is total count minus 1 (the post)
+  rawData["Comments"] = rawData.groupby("PublicId", observed = True)["Type"].transform("count") - 1
+  # participants is unique users including OP, but need to filter for dates
+  inRange = inDateRange(rawData["CreateDate"])
+  rawData["Participants"] = (
+    rawData["User"].where(inRange)
+    .groupby(rawData["PublicId"], observed = True).transform("nunique"))
+
+  nonBot = ~rawData["IsBot"].astype(bool) & ~rawData["PartialBot"].astype(bool)
+  # comments in the dataframe should all be within the date range already
+  sumPostComments = int((nonBot & isComment & inRange).sum())
+  numDiscs = rawData["Disc"][nonBot].nunique()
+  activeUsers = rawData["User"][nonBot & inRange].nunique()
+  # includes posts that are not inside the date range, if a comment was made in range
+  activePosts = rawData["PublicId"][nonBot].nunique()
+  stopwatch.lap("filter")
+
+  if registeredAccounts is None:
+    registeredAccounts = getRegisteredAccounts()
+  printReportHeader(
+    reportFile, rankVar, minVotePct, activeUsers, activePosts,
+    sumPostComments, numDiscs, registeredAccounts)
+  stopwatch.lap("header")
+
+  for postType in sorted(rawData["Type"][~isComment].unique()):
+    subset = rawData[rawData["Type"] == postType].drop(columns = ["Type", "PublicId"])
+    printPostTable(subset, postType, reportFile, rankVar, DiscuitURL)
+  stopwatch.lap("posts")
+
+  # # top comment, by votes, filtered
+  # subset = rawData.query("(Type == 'Comment') & (VotePct >= @minVotePct)").copy()
+  # subset["Rank"] = subset["Upvotes"].rank(method = "min", ascending = False)
+  # subset = subset.query("Rank <= @topX")
+  # subset = subset.sort_values("Rank")
+  # # restrict comment link text to 100 chars
+  # subset["CommentBody"] = subset["CommentBody"].str.replace("\n", " ")
+  # subset.loc[
+  #   subset["CommentBody"].str.len() > 100,
+  #   "CommentBody"
+  # ] = subset["CommentBody"].str.slice(0, 100) + "..."
+
+  # subset["CommentBody"] = (
+  #   "[" + subset["CommentBody"] + f"]({DiscuitURL}/" + subset['Disc'] +
+  #   "/post/" + subset.index + ")")
+  # subset = subset[["Rank", "Disc", "CommentBody", "User", "Upvotes"]]
+  # print(f"## Top {topX} most upvoted comments:", file = reportFile)
+  # print(subset.to_markdown(index = False), file = reportFile)
+  # print("\n\n", file = reportFile)
+
+
+  # disc activity
+  # don't count posts created out-of-date-range (could have been included
+  # due to comments being in date range)... comments should already be in range
+  subset = rawData[nonBot & inRange]
+  discTypes = pluralTypes(subset["Type"])
+  # need to recalculate participants here at disc level, not post
+  participants = (
+    subset.groupby("Disc", as_index = False, observed = True)["User"].nunique()
+    .rename(columns = {"User": "Participants"}))
+  printDiscTable(
+    subset.groupby(["Disc", discTypes], as_index = False, observed = True).size(),
+    participants, reportFile, discRankVar, DiscuitURL)
+  stopwatch.lap("discs")
+
+  # user activity--remove Ghost and bot users from the active users table
+  # (comments count even if created before the date range, e.g. if edited in it)
+  subset = rawData[
+    nonBot & (rawData["User"] != "ghost") & (isComment | inRange)]
+  userTypes = pluralTypes(subset["Type"])
+  printUserTable(
+    subset.groupby(["User", userTypes], as_index = False, observed = True).size(),
+    reportFile, DiscuitURL)
+  stopwatch.lap("users")
+
+######################################################
+
+# Integer keys (posts, disc * numTypes + type...) paired with the Survival
+# of the rows they were taken from, sorted by falling Survival. The rows a
+# report variant keeps are then always a prefix, and counting them by key
+# is a single bincount. Entries can have weights, the number of rows each
+# stands for (see RollupReport). presorted entries are already in falling
+# Survival order, so they aren't sorted again.
+class SurvivalCounts:
+  def __init__(self, keys, survival, weights = None, presorted = False):
+    if not presorted:
+      order = numpy.argsort(-survival, kind = "stable")
+      keys, survival = keys[order], survival[order]
+      weights = None if weights is None else weights[order]
+    self.keys = keys
+    self.negSurvival = -survival
+    self.weights = weights
+
+  # the highest Survival of each distinct (key, member) pair, with key as
+  # the key, so counts gives the number of distinct members per key
+  @classmethod
+  def distinct(cls, keys, members, numMembers, survival, presorted = False):
+    if not presorted:
+      order = numpy.argsort(-survival, kind = "stable")
+      keys, members, survival = keys[order], members[order], survival[order]
+    pairs = keys.astype(numpy.int64) * numMembers + members
+    # the first of each pair has its highest Survival; masking keeps them in
+    # Survival order, and duplicated finds them by hashing, without a sort
+    first = ~pandas.Series(pairs).duplicated().to_numpy()
+    return cls(pairs[first] // numMembers, survival[first], presorted = True)
+
+  # number of entries kept at minVotePct
+  def kept(self, minVotePct):
+    return numpy.searchsorted(self.negSurvival, -minVotePct, side = "right")
+
+  # number of rows kept at minVotePct
+  def total(self, minVotePct):
+    kept = self.kept(minVotePct)
+    if self.weights is None:
+      return kept
+    return int(self.weights[:kept].sum())
+
+  def counts(self, minVotePct, numKeys):
+    kept = self.kept(minVotePct)
+    if self.weights is None:
+      return numpy.bincount(self.keys[:kept], minlength = numKeys)
+    return numpy.bincount(
+      self.keys[:kept], self.weights[:kept], minlength = numKeys).astype(numpy.int64)
+
+# positions among candidates of the values that rank(method = "min",
+# ascending = False) would rank topX or better: all those at least as large
+# as the topX-th largest. Uses a partial sort instead of ranking everything.
+def topCandidates(values, candidates):
+  values = values[candidates]
+  if len(values) > topX:
+    cutoff = numpy.partition(values, len(values) - topX)[len(values) - topX]
+    candidates = candidates[values >= cutoff]
+  return candidates
+
+# Builds any number of (rankVar, minVotePct) report variants from a single
+# aggregation pass over rawData, instead of re-filtering and regrouping a
+# copy of it per report like topXReport. A variant hides rows voted under
+# minVotePct, along with every comment of a post voted under it, so each row
+# gets a Survival percent: its own vote percent, or for a comment the lower
+# of its own and its post's. A row is kept by a variant iff
+# Survival >= minVotePct. Users, discs, posts and types are handled as the
+# integer codes of their categoricals (interned during the crawl), counted
+# with NumPy, and only the top ranked rows of each table are turned back
+# into names.
+class ReportEngine:
+  def __init__(self, rawData):
+    stopwatch = metrics.stopwatch("ReportEngine")
+    isComment = (rawData["Type"] == "Comment").to_numpy()
+    votePct = (100 * rawData["Upvotes"] / (rawData["Upvotes"] + rawData["Downvotes"])).fillna(100)
+    votePct = votePct.to_numpy()
+    inRange = inDateRange(rawData["CreateDate"]).to_numpy()
+    nonBot = ~rawData["IsBot"].astype(bool).to_numpy() & ~rawData["PartialBot"].astype(bool).to_numpy()
+    notGhost = (rawData["User"] != "ghost").to_numpy()
+    post = rawData["PublicId"].cat.codes.to_numpy(dtype = numpy.int64)
+    disc = rawData["Disc"].cat.codes.to_numpy(dtype = numpy.int64)
+    user = rawData["User"].cat.codes.to_numpy(dtype = numpy.int64)
+    postType = rawData["Type"].cat.codes.to_numpy(dtype = numpy.int64)
+    self.discNames = rawData["Disc"].cat.categories.to_numpy(dtype = object)
+    self.userNames = rawData["User"].cat.categories.to_numpy(dtype = object)
+    self.typeNames = [name + "s" for name in rawData["Type"].cat.categories]
+    self.numPosts = len(rawData["PublicId"].cat.categories)
+    postPct = numpy.full(self.numPosts, numpy.inf)
+    postPct[post[~isComment]] = votePct[~isComment]
+    survival = numpy.minimum(votePct, postPct[post])
+    self.posts = rawData.loc[~isComment, ["Type", "Disc", "Title", "User"]]
+    self.aggregate(
+      isComment, survival, inRange, nonBot, notGhost, post, disc, user, postType)
+    self.registeredAccounts = None
+    stopwatch.lap("aggregate")
+
+  # the SurvivalCounts of every table from the per-row arrays, with weights
+  # the number of rows each stands for (None for one each); the names,
+  # numPosts and the post rows must be set
+  def aggregate(self, isComment, survival, inRange, nonBot, notGhost, post,
+                disc, user, postType, weights = None):
+    numDiscs, numUsers, numTypes = (
+      len(self.discNames), len(self.userNames), len(self.typeNames))
+    self.postCodes = post[~isComment]
+    self.postSurvival = survival[~isComment]
+    # every row sorted by falling Survival once; each table's rows keep that
+    # order when masked, so none of the SurvivalCounts sort again
+    order = numpy.argsort(-survival, kind = "stable")
+    isComment, survival, inRange, nonBot, notGhost, post, disc, user, postType = (
+      column[order] for column in (
+        isComment, survival, inRange, nonBot, notGhost, post, disc, user, postType))
+    weightsOf = lambda rows: None if weights is None else weights[order][rows]
+    counts = lambda keys, rows: SurvivalCounts(
+      keys[rows], survival[rows], weightsOf(rows), presorted = True)
+    distinct = lambda keys, members, numMembers, rows: SurvivalCounts.distinct(
+      keys[rows], members[rows], numMembers, survival[rows], presorted = True)
+    # per post: comment counts and participants
+    self.postComments = counts(post, isComment)
+    self.postParticipants = distinct(post, user, numUsers, inRange)
+    # per disc
+    rows = nonBot & inRange
+    self.discTypes = counts(disc * numTypes + postType, rows)
+    self.discUsers = distinct(disc, user, numUsers, rows)
+    # per user--no ghost or bot users, or posts created out of range
+    rows = nonBot & notGhost & (isComment | inRange)
+    self.userTypes = counts(user * numTypes + postType, rows)
+    # summary line
+    self.summaryComments = counts(post, nonBot & isComment & inRange)
+    zeros = numpy.zeros(len(post), dtype = numpy.int64)
+    self.summaryDiscs = distinct(zeros, disc, numDiscs, nonBot)
+    self.summaryUsers = distinct(zeros, user, numUsers, nonBot & inRange)
+    self.summaryPosts = distinct(zeros, post, self.numPosts, nonBot)
+
+  # per-type counts as a (names x types) table, for the given key rows
+  def typeTable(self, counts, candidates, names, nameColumn):
+    order = numpy.argsort(names[candidates], kind = "stable")
+    candidates = candidates[order]
+    table = pandas.DataFrame({nameColumn: names[candidates]})
+    for i, typeName in enumerate(self.typeNames):
+      table[typeName] = counts[candidates, i]
+    return table, candidates
+
+  # total counts of the types rankings are based on, per row of counts
+  def engagement(self, counts):
+    return sum(
+      counts[:, self.typeNames.index(typeName)]
+      for typeName in reportContentTypes if typeName in self.typeNames)
+
+  def report(self, reportFile = None, rankVar = "Comments", minVotePct = 0, DiscuitURL = ""):
+    discRankVar = discRankVarFor(rankVar)
+    numTypes = len(self.typeNames)
+    stopwatch = metrics.stopwatch("ReportEngine")
+    if self.registeredAccounts is None:
+      self.registeredAccounts = getRegisteredAccounts()
+
+    printReportHeader(
+      reportFile, rankVar, minVotePct,
+      self.summaryUsers.kept(minVotePct), self.summaryPosts.kept(minVotePct),
+      self.summaryComments.total(minVotePct), self.summaryDiscs.kept(minVotePct),
+      self.registeredAccounts)
+    stopwatch.lap("header")
+
+    if rankVar == "Comments":
+      postValues = self.postComments.counts(minVotePct, self.numPosts)
+    else:
+      postValues = self.postParticipants.counts(minVotePct, self.numPosts)
+    postValues = postValues[self.postCodes]
+    kept = self.postSurvival >= minVotePct
+    postTypes = self.posts["Type"].to_numpy()
+    for postType in sorted(set(postTypes[kept])):
+      candidates = topCandidates(
+        postValues, numpy.flatnonzero(kept & (postTypes == postType)))
+      subset = self.posts.iloc[candidates].drop(columns = "Type")
+      subset[rankVar] = postValues[candidates]
+      printPostTable(subset, postType, reportFile, rankVar, DiscuitURL)
+    stopwatch.lap("posts")
+
+    counts = self.discTypes.counts(minVotePct, len(self.discNames) * numTypes)
+    counts = counts.reshape(len(self.discNames), numTypes)
+    participants = self.discUsers.counts(minVotePct, len(self.discNames))
+    if discRankVar == "Participants":
+      rankValues = participants
+    else:
+      rankValues = self.engagement(counts)
+    candidates = topCandidates(
+      rankValues, numpy.flatnonzero(counts.sum(axis = 1)))
+    subset, candidates = self.typeTable(counts, candidates, self.discNames, "Disc")
+    subset["Participants"] = participants[candidates]
+    printDiscRanking(subset, reportFile, discRankVar, DiscuitURL)
+    stopwatch.lap("discs")
+
+    counts = self.userTypes.counts(minVotePct, len(self.userNames) * numTypes)
+    counts = counts.reshape(len(self.userNames), numTypes)
+    candidates = topCandidates(
+      self.engagement(counts), numpy.flatnonzero(counts.sum(axis = 1)))
+    subset, candidates = self.typeTable(counts, candidates, self.userNames, "User")
+    printUserRanking(subset, reportFile, DiscuitURL)
+    stopwatch.lap("users")
+
+# SQL vote percent of the rows aliased table, as in topXReport
+def sqlVotePct(table):
+  return (
+    f"(case when {table}.Upvotes + {table}.Downvotes = 0 then 100.0 "
+    f"else 100.0 * {table}.Upvotes / ({table}.Upvotes + {table}.Downvotes) end)")
+
+# ReportEngine for the rows of a SpillStore, aggregated by SQLite instead of
+# in memory: one pass gives every row its Survival (see ReportEngine) in a
+# temporary table, and each variant is a handful of group by queries over
+# it. Only the per-post, per-disc and per-user results are loaded, never
+# the comments, and the tables are printed the same as ReportEngine's.
+class StoreReport:
+  def __init__(self, store):
+    stopwatch = metrics.stopwatch("StoreReport")
+    store.db.commit()
+    self.db = store.db
+    self.db.execute("pragma temp_store = file")
+    self.db.execute("drop table if exists temp.survival")
+    self.db.execute(f"""
+      create temp table survival as
+      select row.row, row.rowId, row.Type, row.Disc, row.Title, row.User,
+        row.PublicId, row.Type = 'Comment' as isComment,
+        not (row.IsBot or row.PartialBot) as nonBot,
+        row.CreateDate between ? and ? as inRange,
+        min({sqlVotePct("row")},
+            coalesce({sqlVotePct("post")}, {sqlVotePct("row")})) as survival
+      from rows as row left join rows as post
+        on post.rowId = row.PublicId and post.Type != 'Comment'""",
+      (int(fromDate or 0), int(toDate or 99999999)))
+    self.registeredAccounts = None
+    stopwatch.lap("aggregate")
+
+  def count(self, query, minVotePct):
+    return self.db.execute(
+      f"select {query} and survival >= ?", (minVotePct,)).fetchone()[0]
+
+  # per-type counts of the rows matching condition, as a table with a row
+  # per name (sorted) and a plural type column each ("Texts"...)
+  def typeTable(self, nameColumn, condition, minVotePct):
+    typeCounts = pandas.read_sql_query(
+      f"select {nameColumn}, Type, count(*) as size from survival "
+      f"where {condition} and survival >= ? group by {nameColumn}, Type",
+      self.db, params = (minVotePct,))
+    typeCounts["Type"] = typeCounts["Type"] + "s"
+    table = typeCounts.pivot_table(
+      index = nameColumn, columns = "Type", values = "size", aggfunc = "sum",
+      fill_value = 0)
+    table.columns.name = None
+    return table.reset_index()
+
+  # positions of the table rows ranked topX or better by values, in order
+  def topRows(self, values):
+    return topCandidates(values, numpy.arange(len(values)))
+
+  def engagement(self, table):
+    return sum(
+      (table[typeName].to_numpy() for typeName in reportContentTypes
+       if typeName in table),
+      numpy.zeros(len(table), dtype = numpy.int64))
+
+  def report(self, reportFile = None, rankVar = "Comments", minVotePct = 0, DiscuitURL = ""):
+    discRankVar = discRankVarFor(rankVar)
+    stopwatch = metrics.stopwatch("StoreReport")
+    if self.registeredAccounts is None:
+      self.registeredAccounts = getRegisteredAccounts()
+
+    printReportHeader(
+      reportFile, rankVar, minVotePct,
+      self.count("count(distinct User) from survival where nonBot and inRange", minVotePct),
+      self.count("count(distinct PublicId) from survival where nonBot", minVotePct),
+      self.count("count(*) from survival where nonBot and isComment and inRange", minVotePct),
+      self.count("count(distinct Disc) from survival where nonBot", minVotePct),
+      self.registeredAccounts)
+    stopwatch.lap("header")
+
+    # every post's rankVar value goes to a temporary table, and only the rows
+    # of each type at or above its topX-th largest value are loaded, as
+    # topCandidates would pick them
+    if rankVar == "Comments":
+      value, condition = "count(*)", "isComment"
+    else:
+      value, condition = "count(distinct User)", "inRange"
+    self.db.execute("drop table if exists temp.postValues")
+    self.db.execute(f"""
+      create temp table postValues as
+      select post.row, post.rowId, post.Type, post.Disc, post.Title, post.User,
+        coalesce(counted.value, 0) as value
+      from survival as post left join (
+        select PublicId, {value} as value from survival
+        where {condition} and survival >= ? group by PublicId) as counted
+        on counted.PublicId = post.rowId
+      where not post.isComment and post.survival >= ?""",
+      (minVotePct, minVotePct))
+    postTypes = [postType for (postType,) in self.db.execute(
+      "select distinct Type from postValues order by Type")]
+    for postType in postTypes:
+      cutoff = self.db.execute(
+        "select value from postValues where Type = ? order by value desc "
+        "limit 1 offset ?", (postType, topX - 1)).fetchone()
+      subset = pandas.read_sql_query(
+        "select rowId, Disc, Title, User, value from postValues "
+        "where Type = ? and value >= ? order by row",
+        self.db, params = (postType, cutoff[0] if cutoff else 0),
+        index_col = "rowId")
+      subset = subset.rename(columns = {"value": rankVar})
+      printPostTable(subset, postType, reportFile, rankVar, DiscuitURL)
+    stopwatch.lap("posts")
+
+    condition = "nonBot and inRange"
+    discs = self.typeTable("Disc", condition, minVotePct)
+    participants = dict(self.db.execute(
+      f"select Disc, count(distinct User) from survival where {condition} "
+      "and survival >= ? group by Disc", (minVotePct,)))
+    discs["Participants"] = numpy.array(
+      [participants[disc] for disc in discs["Disc"]], dtype = numpy.int64)
+    if discRankVar == "Participants":
+      rankValues = discs["Participants"].to_numpy()
+    else:
+      rankValues = self.engagement(discs)
+    subset = discs.iloc[self.topRows(rankValues)].reset_index(drop = True)
+    printDiscRanking(subset, reportFile, discRankVar, DiscuitURL)
+    stopwatch.lap("discs")
+
+    # no ghost or bot users, or posts created out of range
+    users = self.typeTable(
+      "User", "nonBot and User != 'ghost' and (isComment or inRange)", minVotePct)
+    subset = users.iloc[self.topRows(self.engagement(users))].reset_index(drop = True)
+    printUserRanking(subset, reportFile, DiscuitURL)
+    stopwatch.lap("users")
+
+######################################################
+# Weekly archive. Each week's rawData is kept as an uncompressed Arrow IPC
+# file, DiscuitActivity_{fromDate}_{toDate}.arrow, so it is read back
+# memory-mapped, with the categoricals and dtypes of the compact schema, and
+# no parsing; a year of weeks loads in seconds where the CSVs took minutes.
+
+def archiveFileName(directory, weekFrom, weekTo):
+  return os.path.join(directory, f"DiscuitActivity_{weekFrom}_{weekTo}.arrow")
+
+# save rawData as the fromDate-toDate week of the archive, replacing what an
+# earlier run saved for the same week
+def archiveWeek(rawData, directory):
+  import pyarrow, pyarrow.ipc
+  os.makedirs(directory, exist_ok = True)
+  table = pyarrow.Table.from_pandas(rawData.rename_axis("index"))
+  fileName = archiveFileName(directory, fromDate, toDate)
+  with pyarrow.OSFile(fileName + ".tmp", "wb") as sink:
+    with pyarrow.ipc.new_file(sink, table.schema) as writer:
+      writer.write_table(table)
+  # a crash while writing leaves the previous file for the week in place
+  os.replace(fileName + ".tmp", fileName)
+
+# (weekFrom, weekTo, fileName) of every archived week, oldest first
+def archivedWeeks(directory):
+  weeks = []
+  for fileName in os.listdir(directory):
+    match = re.fullmatch(r"DiscuitActivity_(\d*)_(\d*)\.arrow", fileName)
+    if match:
+      weeks.append(
+        (match.group(1), match.group(2), os.path.join(directory, fileName)))
+  return sorted(weeks)
+
+# the archived rawData, or just the given columns of it
+def readArchiveWeek(fileName, columns = None):
+  import pyarrow, pyarrow.ipc
+  with pyarrow.memory_map(fileName) as source:
+    table = pyarrow.ipc.open_file(source).read_all()
+    if columns is not None:
+      table = table.select(columns)
+    return table.to_pandas()
+
+trendColumns = ["Type", "Disc", "User", "PublicId", "IsBot", "CreateDate", "PartialBot"]
+
+# the report header's numbers (at minVotePct 0) for one archived week, plus
+# its trendTopDiscs most active discs
+def weekSummary(rawData, dateRange):
+  inRange = inDateRange(rawData["CreateDate"], dateRange)
+  nonBot = ~rawData["IsBot"].astype(bool) & ~rawData["PartialBot"].astype(bool)
+  isComment = rawData["Type"] == "Comment"
+  discActivity = rawData.loc[nonBot & inRange, "Disc"].value_counts()
+  discActivity = discActivity[discActivity > 0].head(trendTopDiscs)
+  return {
+    "ActiveUsers": rawData.loc[nonBot & inRange, "User"].nunique(),
+    "ActivePosts": rawData.loc[nonBot, "PublicId"].nunique(),
+    "Comments": int((nonBot & isComment & inRange).sum()),
+    "Discs": rawData.loc[nonBot, "Disc"].nunique(),
+    "TopDiscs": ", ".join(
+      f"{disc} ({activity})" for disc, activity in discActivity.items())}
+
+# week-over-week trends across the archive: one row per week with the
+# weekSummary numbers and their percent change from the week before
+def weeklyTrends(directory):
+  summaries = []
+  for weekFrom, weekTo, fileName in archivedWeeks(directory):
+    rawData = readArchiveWeek(fileName, trendColumns)
+    summary = weekSummary(rawData, (weekFrom, weekTo))
+    summaries.append({"Week": f"{weekFrom}-{weekTo}", **summary})
+  trends = pandas.DataFrame(
+    summaries, columns = ["Week", "ActiveUsers", "ActivePosts", "Comments",
+                          "Discs", "TopDiscs"])
+  for column in ["ActiveUsers", "ActivePosts", "Comments", "Discs"]:
+    change = 100 * trends[column].pct_change()
+    trends.insert(
+      trends.columns.get_loc(column) + 1, column + "Change%", change.round(1))
+  return trends
+
+def printTrends(directory, reportFile = None):
+  print("# Week-over-week trends\n", file = reportFile)
+  print(weeklyTrends(directory).to_markdown(index = False), file = reportFile)
+
+######################################################
+# Daily rollups. A crawl's comments are boiled down to a count per day,
+# disc, post, user, bot flag and Survival (see ReportEngine) in whole
+# percents, so minVotePct is taken in whole percents too. Those rows are at
+# once the per-post comment counts and participant sets and, grouped by disc
+# or by user, the per-disc and per-user ones, so distinct participants over
+# any range of days stay exact. Posts are kept once each, with their latest
+# votes. Discs, users and posts are stored as integer ids of their names, so
+# a range loads as plain integers. A crawl only speaks for the days of its
+# fromDate-toDate window, so it replaces just those.
+
+class DailyRollups:
+  def __init__(self, fileName):
+    self.db = sqlite3.connect(fileName)
+    self.db.executescript("""
+      create table if not exists names (
+        id integer primary key, name text unique not null);
+      create table if not exists activity (
+        day integer not null, disc integer, post integer, user integer,
+        nonBot integer, survival integer, count integer);
+      create index if not exists activityDay on activity (day);
+      create table if not exists posts (
+        post integer unique, Type text, disc integer, Title text,
+        user integer, nonBot integer, survival real, CreateDate integer);""")
+
+  # replace the fromDate-toDate days with the crawled rows of table, which
+  # has the rawDataColumns plus row and rowId (like a SpillStore's), and add
+  # or update its posts, in row order
+  def addCrawl(self, table):
+    dateRange = (int(fromDate or 0), int(toDate or 99999999))
+    nonBot = "not (coalesce(row.IsBot, 0) or coalesce(row.PartialBot, 0))"
+    with self.db:
+      self.db.execute(f"""
+        insert or ignore into names (name)
+        select Disc from {table} union select User from {table}
+        union select PublicId from {table}""")
+      self.db.execute("delete from activity where day between ? and ?", dateRange)
+      self.db.execute(f"""
+        insert into activity
+        select row.CreateDate, disc.id, post.id, user.id, {nonBot},
+          cast(min({sqlVotePct("row")},
+                   coalesce({sqlVotePct("postRow")}, {sqlVotePct("row")})) as integer),
+          count(*)
+        from {table} as row
+          left join {table} as postRow
+            on postRow.rowId = row.PublicId and postRow.Type != 'Comment'
+          join names as disc on disc.name = row.Disc
+          join names as post on post.name = row.PublicId
+          join names as user on user.name = row.User
+        where row.Type = 'Comment' and row.CreateDate between ? and ?
+        group by 1, 2, 3, 4, 5, 6""", dateRange)
+      self.db.execute(f"""
+        insert into posts
+        select post.id, row.Type, disc.id, row.Title, user.id, {nonBot},
+          {sqlVotePct("row")}, row.CreateDate
+        from {table} as row
+          join names as disc on disc.name = row.Disc
+          join names as post on post.name = row.PublicId
+          join names as user on user.name = row.User
+        where row.Type != 'Comment' order by row.row
+        on conflict (post) do update set
+          Type = excluded.Type, disc = excluded.disc, Title = excluded.Title,
+          user = excluded.user, nonBot = excluded.nonBot,
+          survival = excluded.survival, CreateDate = excluded.CreateDate""")
+
+  # roll up a crawl's rawData
+  def addRawData(self, rawData):
+    columns = ["Type", "Disc", "Title", "User", "PublicId", "IsBot",
+               "PartialBot", "CreateDate", "Upvotes", "Downvotes"]
+    self.db.execute("drop table if exists temp.crawl")
+    self.db.execute(
+      f"create temp table crawl (row integer primary key, "
+      f"rowId text unique, {SpillStore.columnList(columns)})")
+    rows = rawData[columns].astype({
+      "IsBot": bool, "PartialBot": bool, "CreateDate": "int64",
+      "Upvotes": "int64", "Downvotes": "int64"})
+    self.db.executemany(
+      f"insert into temp.crawl (rowId, {SpillStore.columnList(columns)}) "
+      f"values (?{', ?' * len(columns)})",
+      zip(rawData.index, *(rows[column].astype(object) for column in columns)))
+    self.addCrawl("temp.crawl")
+    self.db.execute("drop table temp.crawl")
+
+  # roll up the rows of a SpillStore
+  def addSpill(self, store):
+    store.db.commit()
+    self.db.execute("attach database ? as spill", (store.fileName,))
+    try:
+      self.addCrawl("spill.rows")
+    finally:
+      self.db.execute("detach database spill")
+
+  # the names of the given ids, as an object array
+  def names(self, ids):
+    names = numpy.empty(int(ids.max(initial = 0)) + 1, dtype = object)
+    for nameId, name in self.db.execute(
+        "select id, name from names where id <= ?", (len(names) - 1,)):
+      names[nameId] = name
+    return names[ids]
+
+  # first and last day held, None and None if none are
+  def days(self):
+    return self.db.execute("select min(day), max(day) from activity").fetchone()
+
+# ReportEngine over the daily rollups of fromDate-toDate instead of a
+# crawl's rawData: the rows are every post created or commented on in the
+# range, plus the rollup rows weighted by their counts, which give the
+# reports a crawl of the range would. Except that comments count on the day
+# they were created, so those created before the range and edited in it
+# are left out, as are posts whose only activity in the range was such an
+# edit.
+class RollupReport(ReportEngine):
+  def __init__(self, rollups):
+    stopwatch = metrics.stopwatch("RollupReport")
+    dateRange = (int(fromDate or 0), int(toDate or 99999999))
+    posts = pandas.read_sql_query("""
+      select post, Type, disc, Title, user, nonBot, survival,
+        CreateDate between ?1 and ?2 as inRange
+      from posts
+      where CreateDate between ?1 and ?2 or post in (
+        select post from activity where day between ?1 and ?2)
+      order by rowid""", rollups.db, params = dateRange)
+    # an empty range reads object columns, which would make float ids
+    posts = posts.astype({"post": "int64", "disc": "int64", "user": "int64"})
+    comments = numpy.array(rollups.db.execute(
+      "select disc, post, user, nonBot, survival, count from activity "
+      "where day between ? and ?", dateRange).fetchall(), dtype = numpy.int64)
+    comments = comments.reshape(-1, 6)
+    stopwatch.lap("load")
+
+    # post rows first, then comment rows, as in rawData; ids become codes
+    # numbered in name id order
+    isComment = numpy.arange(len(posts) + len(comments)) >= len(posts)
+    codes = lambda postIds, commentIds: numpy.unique(
+      numpy.concatenate([postIds, commentIds]), return_inverse = True)
+    discIds, disc = codes(posts["disc"], comments[:, 0])
+    postIds, post = codes(posts["post"], comments[:, 1])
+    userIds, user = codes(posts["user"], comments[:, 2])
+    typeNames = sorted(set(posts["Type"]) | {"Comment"})
+    postType = numpy.concatenate([
+      posts["Type"].map(typeNames.index).to_numpy(dtype = numpy.int64),
+      numpy.full(len(comments), typeNames.index("Comment"))])
+    self.discNames = rollups.names(discIds)
+    self.userNames = rollups.names(userIds)
+    self.typeNames = [name + "s" for name in typeNames]
+    self.numPosts = len(postIds)
+    self.posts = pandas.DataFrame({
+      "Type": posts["Type"].to_numpy(),
+      "Disc": self.discNames[disc[:len(posts)]],
+      "Title": posts["Title"].to_numpy(),
+      "User": self.userNames[user[:len(posts)]]},
+      index = rollups.names(posts["post"].to_numpy()))
+    self.aggregate(
+      isComment,
+      numpy.concatenate([posts["survival"], comments[:, 4]]).astype(float),
+      numpy.concatenate([posts["inRange"].astype(bool), numpy.ones(len(comments), bool)]),
+      numpy.concatenate([posts["nonBot"], comments[:, 3]]).astype(bool),
+      ~numpy.isin(user, numpy.flatnonzero(self.userNames == "ghost")),
+      post, disc, user, postType,
+      numpy.concatenate([numpy.ones(len(posts), numpy.int64), comments[:, 5]]))
+    self.registeredAccounts = None
+    stopwatch.lap("aggregate")
+
 ######################################################
 
-rawData = generateTables(nextPage)
-if exportCSV:
-  rawData.drop(columns = ["Upvotes", "Downvotes", "CommentBody"]).to_csv(exportCSV, index_label = "index")
-#rawData = finishData(rawData)
-if reportFileName:
-  with open(reportFileName, "w") as reportFile:
-    topXReport(rawData, reportFile)
-    # topXReport(rawData, reportFile, rankVar = "Comments", minVotePct = 50, DiscuitURL = baseURL)
+# write the reportVariants of reportEngine (a ReportEngine or StoreReport)
+# to reportFileName, or print them
+def writeReports(reportEngine):
+  if reportFileName:
+    with open(reportFileName, "w") as reportFile:
+      for rankVar, minVotePct in reportVariants:
+        reportEngine.report(reportFile, rankVar, minVotePct)
+  else:
+    for rankVar, minVotePct in reportVariants:
+      reportEngine.report(None, rankVar, minVotePct)
+
+# write the reports of fromDate-toDate from the daily rollups, as --range
+# does, if they hold any of its days
+def runRange():
+  rollups = DailyRollups(rollupFile)
+  first, last = rollups.days()
+  if first is None or int(fromDate or 0) > last or int(toDate or 99999999) < first:
+    held = f"only {first}-{last}" if first is not None else "no days"
+    print(f"The daily rollups in {rollupFile} hold {held}, none of "
+          f"{fromDate}-{toDate}")
+    return
+  writeReports(RollupReport(rollups))
 
-    # topXReport(rawData, reportFile, rankVar = "Participants", minVotePct = 0, DiscuitURL = baseURL)
-    # topXReport(rawData, reportFile, rankVar = "Participants", minVotePct = 50, DiscuitURL = baseURL)
+# crawl fromDate-toDate and write the exports, archive, rollups and
+# reports, as a command line run does; with resume, continues from the
+# checkpoint journal
+def run(resume = False):
+  profiler = None
+  if profileFile:
+    profiler = cProfile.Profile()
+    profiler.enable()
+  csvFile = exportCSV and exportCSV.format(fromDate = fromDate, toDate = toDate)
+  # the metrics are saved even if the run fails, to show where it got to
+  try:
+    if spillFile:
+      records = crawlRecords(nextPage, resume)
+      try:
+        if csvFile:
+          records.toCSV(csvFile, exclude = ["Upvotes", "Downvotes"])
+        if rollupFile:
+          DailyRollups(rollupFile).addSpill(records)
+        # the report is aggregated from the spilled rows by SQLite
+        writeReports(StoreReport(records))
+      finally:
+        records.close()
+    else:
+      rawData = generateTables(nextPage, resume)
+      if csvFile:
+        rawData.drop(columns = ["Upvotes", "Downvotes"]).to_csv(csvFile, index_label = "index")
+      if archiveDir:
+        archiveWeek(rawData, archiveDir)
+      if rollupFile:
+        DailyRollups(rollupFile).addRawData(rawData)
+      #rawData = finishData(rawData)
+      # all the report variants share one aggregation pass over rawData
+      writeReports(ReportEngine(rawData))
+  finally:
+    if profiler:
+      profiler.disable()
+      profiler.dump_stats(profileFile)
+    if metricsFile:
+      metrics.save(metricsFile)
 
-else:
-  topXReport(rawData)
+# run every daemonInterval seconds, for good, or for the given number of
+# runs; a run that fails, e.g. to reach the site, is reported and the next
+# one tries again
+def runDaemon(runs = None):
+  global crawlStore, metrics, fromDate, toDate
+  if crawlStore is None:
+    crawlStore = CrawlStore(crawlStoreFile or ":memory:")
+  while runs is None or runs > 0:
+    started = time.monotonic()
+    if daemonDays:
+      today = datetime.datetime.now(datetime.timezone.utc).date()
+      fromDate = (today - datetime.timedelta(days = daemonDays - 1)).strftime("%Y%m%d")
+      toDate = today.strftime("%Y%m%d")
+    print(f"Daemon run for {fromDate}-{toDate} at {datetime.datetime.now()}")
+    metrics = CrawlMetrics()
+    try:
+      run()
+    except Exception as error:
+      print(f"Run failed, trying again next time: {error!r}")
+    if runs is not None:
+      runs -= 1
+      if runs == 0:
+        break
+    time.sleep(max(0, daemonInterval - (time.monotonic() - started)))
 
+if __name__ == "__main__":
+  commandLine, flags = parseCommandLine(sys.argv[1:])
+  commandLine.apply()
+  if "--trends" in flags:
+    if archiveDir:
+      printTrends(archiveDir)
+    else:
+      print("Set archiveDir to the weekly archive to show its trends")
+  elif "--range" in flags:
+    if rollupFile:
+      runRange()
+    else:
+      print("Set rollupFile to the daily rollups to report a range from them")
+  elif "--daemon" in flags:
+    runDaemon()
+  else:
+    run("--resume" in flags)
@@ -0,0 +1,323 @@
+import json, random, threading, datetime, time, sys, bisect
+import http.server, urllib.parse, multiprocessing
+
+# Local stand-in for the parts of the Discuit API that discuitstats uses:
+#   /api/posts?sort=activity&next=...&communityId=...  activity feed
+#   /api/posts/{publicId}                              post with first comments
+#   /api/posts/{publicId}/comments?next=...            more comments
+#   /api/posts/{publicId}/comments?sort=new&next=...   comments, newest first
+#   /api/communities                                   community list
+#   /api/_initial                                      site totals
+# The posts and comments are generated from a seed, so every run against the
+# same settings crawls the same data. Run as "python fakediscuit.py [port]"
+# and set baseURL = "http://localhost:8080" in discuitstats.py, or start one
+# from code (see benchmark.py).
+
+##########################################################
+
+def serverDate(seconds):
+  return datetime.datetime.fromtimestamp(
+    seconds, tz = datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def dateSeconds(date):
+  return datetime.datetime.strptime(date, "%Y%m%d").replace(
+    tzinfo = datetime.timezone.utc).timestamp()
+
+# numPosts posts in numDiscs discs, created from daysBefore days before
+# fromDate to the day after toDate, each with up to maxComments comments
+# nested up to commentDepth deep. latency seconds are added to every
+# response. Every bumpEvery requests (0 for never), up to maxBumps times,
+# a post the crawl has probably passed already gets a new comment, moving it
+# to the top of the activity feed as if a user had bumped it mid-crawl.
+# bumpSeconds bumps once that many seconds have passed since the first
+# request or the last bump instead, independently of how many requests the
+# crawl makes.
+# The first megathreads posts are created daysBefore days before fromDate
+# and get megathreadComments comments spread evenly up to the present.
+class FakeDiscuit:
+  def __init__(self, numPosts = 2000, maxComments = 60, commentDepth = 4,
+               numUsers = 500, numDiscs = 40, fromDate = "20260524",
+               toDate = "20260531", daysBefore = 14, latency = 0,
+               bumpEvery = 0, bumpSeconds = 0, maxBumps = 50, feedPageSize = 10,
+               commentPageSize = 10, megathreads = 0,
+               megathreadComments = 2000, seed = 0):
+    self.latency = latency
+    self.bumpEvery = bumpEvery
+    self.bumpSeconds = bumpSeconds
+    self.lastBump = None
+    self.maxBumps = maxBumps
+    self.feedPageSize = feedPageSize
+    self.commentPageSize = commentPageSize
+    self.random = random.Random(seed)
+    self.users = [f"user{i}" for i in range(numUsers)]
+    self.discs = [f"Disc{i}" for i in range(numDiscs)]
+    self.numUsers = numUsers
+    self.lock = threading.Lock()
+    self.stats = {"requests": 0, "bytes": 0, "bumps": 0}
+    self.server = None
+
+    start = dateSeconds(fromDate) - daysBefore * 86400
+    self.now = dateSeconds(toDate) + 2 * 86400
+    self.posts = dict()
+    self.comments = dict()
+    for i in range(numPosts):
+      publicId = f"P{i:06}"
+      if i < megathreads:
+        createdAt = start
+        self.comments[publicId] = self.commentTree(
+          publicId, createdAt, megathreadComments, commentDepth, self.now)
+      else:
+        createdAt = self.random.uniform(start, self.now - 86400)
+        self.comments[publicId] = self.commentTree(
+          publicId, createdAt, self.random.randint(0, maxComments), commentDepth)
+      lastActivity = max(
+        [createdAt] + [comment["seconds"] for comment in self.comments[publicId]])
+      disc = self.random.randrange(numDiscs)
+      self.posts[publicId] = {
+        "id": f"id{i}", "publicId": publicId,
+        "type": self.random.choice(["text", "image", "link"]),
+        "title": f"Post {i} [{self.random.choice(['news', 'chat', 'pics'])}]",
+        "username": self.randomUser(), "communityId": f"cid{disc}",
+        "communityName": self.discs[disc], "createdAt": serverDate(createdAt),
+        "lastActivityAt": lastActivity,
+        "noComments": len(self.comments[publicId]),
+        "upvotes": self.random.randint(0, 40),
+        "downvotes": self.random.randint(0, 8)}
+    # the feed cursor is a lastActivityAt, so no two posts may share one
+    lastActivity = None
+    for post in sorted(self.posts.values(), key = lambda post: post["lastActivityAt"]):
+      seconds = int(post["lastActivityAt"])
+      if lastActivity is not None and seconds <= lastActivity:
+        seconds = lastActivity + 1
+      post["lastActivityAt"] = lastActivity = seconds
+    self.sortFeed()
+
+  def randomUser(self):
+    roll = self.random.random()
+    # deleted accounts, and a bot and a partial bot from discuitstats' lists
+    if roll < 0.02:
+      return ["ghost", "autotldr", "ILostTheGame"][int(roll * 150)]
+    # a few users write most of the comments
+    return self.users[int(len(self.users) * self.random.random() ** 3)]
+
+  # comments listed in thread order, each either top level or a reply to an
+  # earlier comment less than depth deep. With until, top level comments are
+  # spread evenly from createdAt to until rather than bunched after it
+  def commentTree(self, publicId, createdAt, numComments, depth, until = None):
+    comments = []
+    for i in range(numComments):
+      parent = None
+      if comments and self.random.random() < 0.6:
+        parent = self.random.choice(comments)
+        if parent["depth"] + 1 >= depth:
+          parent = None
+      if until and not parent:
+        seconds = self.random.uniform(createdAt, until)
+      else:
+        seconds = min(
+          self.now, (parent or {"seconds": createdAt})["seconds"] +
+          self.random.expovariate(1 / 20000))
+      username = self.randomUser()
+      comment = {
+        "id": f"c{i}", "postPublicId": publicId,
+        "parentId": parent and parent["id"],
+        "depth": parent["depth"] + 1 if parent else 0,
+        "ancestors": (parent["ancestors"] or []) + [parent["id"]] if parent else None,
+        "username": username,
+        "body": ("[BOT] " if username == "ILostTheGame" and self.random.random() < 0.5
+                 else "") + "comment text " * self.random.randint(1, 30),
+        "upvotes": self.random.randint(0, 12),
+        "downvotes": self.random.randint(0, 3),
+        "createdAt": serverDate(seconds),
+        "editedAt": serverDate(seconds + 600) if self.random.random() < 0.05 else None,
+        "deletedAt": serverDate(seconds + 60) if self.random.random() < 0.02 else None,
+        "seconds": seconds}
+      if parent:
+        # replies go after their parent's other replies
+        position = comments.index(parent) + 1
+        while position < len(comments) and comments[position]["depth"] > parent["depth"]:
+          position += 1
+        comments.insert(position, comment)
+      else:
+        comments.append(comment)
+    return comments
+
+  # the activity feed, newest first, overall and per communityId
+  def sortFeed(self):
+    feed = sorted(
+      self.posts.values(), key = lambda post: post["lastActivityAt"], reverse = True)
+    self.feeds = {None: feed}
+    for post in feed:
+      self.feeds.setdefault(post["communityId"], []).append(post)
+    self.feedKeys = {
+      community: [-post["lastActivityAt"] for post in posts]
+      for community, posts in self.feeds.items()}
+
+  def bump(self):
+    feed = self.feeds[None]
+    post = feed[self.random.randrange(len(feed) // 4, len(feed))]
+    seconds = feed[0]["lastActivityAt"] + 1
+    self.comments[post["publicId"]].append({
+      "id": f"b{self.stats['bumps']}", "postPublicId": post["publicId"],
+      "parentId": None, "depth": 0, "ancestors": None,
+      "username": self.randomUser(), "body": "bump", "upvotes": 1,
+      "downvotes": 0, "createdAt": serverDate(seconds), "editedAt": None,
+      "deletedAt": None, "seconds": seconds})
+    post["lastActivityAt"] = seconds
+    post["noComments"] += 1
+    self.stats["bumps"] += 1
+    self.sortFeed()
+
+  ##########################################################
+  # API responses
+
+  def postJSON(self, post):
+    return dict(post, lastActivityAt = serverDate(post["lastActivityAt"]))
+
+  # a page of a post's comments from start, in thread order or, with sort
+  # "new", newest first
+  def commentsJSON(self, publicId, start, sort = None):
+    comments = self.comments[publicId]
+    if sort == "new":
+      comments = sorted(comments, key = lambda comment: comment["seconds"], reverse = True)
+    end = start + self.commentPageSize
+    return (
+      [{key: value for key, value in comment.items() if key != "seconds"}
+       for comment in comments[start:end]],
+      str(end) if end < len(comments) else None)
+
+  # cursors are the lastActivityAt, in nanoseconds, of the last post of the
+  # previous page, as on discuit.org
+  def feedPage(self, query):
+    community = query.get("communityId")
+    posts = self.feeds.get(community, [])
+    start = 0
+    if query.get("next"):
+      cursor = int(query["next"]) // 10**9
+      start = bisect.bisect_right(self.feedKeys[community], -cursor)
+    page = posts[start:start + self.feedPageSize]
+    more = start + self.feedPageSize < len(posts)
+    return {
+      "posts": [self.postJSON(post) for post in page],
+      "next": str(page[-1]["lastActivityAt"] * 10**9) if page and more else None}
+
+  # (status, JSON object) for a GET of path
+  def respond(self, path, query):
+    with self.lock:
+      self.stats["requests"] += 1
+      if (self.bumpEvery and self.stats["requests"] % self.bumpEvery == 0 and
+          self.stats["bumps"] < self.maxBumps):
+        self.bump()
+      if self.bumpSeconds and self.stats["bumps"] < self.maxBumps:
+        now = time.monotonic()
+        if self.lastBump is None:
+          self.lastBump = now
+        elif now - self.lastBump >= self.bumpSeconds:
+          self.lastBump = now
+          self.bump()
+      parts = path.strip("/").split("/")
+      if path == "/api/_initial":
+        return 200, {"noUsers": self.numUsers}
+      if path == "/api/posts":
+        return 200, self.feedPage(query)
+      if path == "/api/communities":
+        return 200, [
+          {"id": f"cid{i}", "name": disc,
+           "noMembers": len(self.feeds.get(f"cid{i}", []))}
+          for i, disc in enumerate(self.discs)]
+      if len(parts) < 3 or parts[:2] != ["api", "posts"] or parts[2] not in self.posts:
+        return 404, {"status": 404, "message": "Not found"}
+      publicId = parts[2]
+      if len(parts) == 3:
+        comments, commentsNext = self.commentsJSON(publicId, 0)
+        return 200, dict(
+          self.postJSON(self.posts[publicId]), comments = comments,
+          commentsNext = commentsNext)
+      if len(parts) == 4 and parts[3] == "comments":
+        comments, commentsNext = self.commentsJSON(
+          publicId, int(query.get("next") or 0), query.get("sort"))
+        return 200, {"comments": comments, "next": commentsNext}
+      return 404, {"status": 404, "message": "Not found"}
+
+  ##########################################################
+
+  # serve on a background thread; port 0 picks a free port. Returns the
+  # base URL to set as discuitstats.baseURL
+  def start(self, port = 0):
+    fake = self
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+      protocol_version = "HTTP/1.1"
+      # headers and body go out in separate writes, which would otherwise
+      # wait on delayed ACKs
+      disable_nagle_algorithm = True
+
+      def log_message(self, *args):
+        pass
+
+      def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        if fake.latency:
+          time.sleep(fake.latency)
+        status, response = fake.respond(url.path, query)
+        body = json.dumps(response).encode()
+        with fake.lock:
+          fake.stats["bytes"] += len(body)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    self.server = http.server.ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    self.server.daemon_threads = True
+    threading.Thread(target = self.server.serve_forever, daemon = True).start()
+    return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+  def stop(self):
+    if self.server:
+      self.server.shutdown()
+      self.server.server_close()
+      self.server = None
+
+def serveFromChild(settings, connection):
+  fake = FakeDiscuit(**settings)
+  connection.send(fake.start())
+  connection.recv() # told to stop
+  fake.stop()
+  connection.send(fake.stats)
+
+# A FakeDiscuit in a child process, so that serving the crawl competes with
+# it neither for the GIL nor in the crawl's tracemalloc numbers. Takes the
+# FakeDiscuit settings; stop returns the server's stats.
+class FakeDiscuitProcess:
+  def __init__(self, **settings):
+    self.settings = settings
+    self.process = None
+
+  def start(self):
+    self.connection, childConnection = multiprocessing.Pipe()
+    self.process = multiprocessing.Process(
+      target = serveFromChild, args = (self.settings, childConnection),
+      daemon = True)
+    self.process.start()
+    return self.connection.recv()
+
+  def stop(self):
+    self.connection.send("stop")
+    stats = self.connection.recv()
+    self.process.join()
+    return stats
+
+##########################################################
+
+if __name__ == "__main__":
+  port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+  fake = FakeDiscuit()
+  print(f"Fake Discuit API on {fake.start(port)} with {len(fake.posts)} posts")
+  try:
+    while True:
+      time.sleep(3600)
+  except KeyboardInterrupt:
+    fake.stop()
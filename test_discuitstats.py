@@ -0,0 +1,121 @@
+import pytest, requests
+import discuitstats, fakediscuit
+
+# a FakeDiscuit to crawl, with the settings of a run against it that writes
+# nothing but its report; every setting is restored afterwards
+@pytest.fixture
+def fake(tmp_path):
+  settings = discuitstats.Config.current()
+  server = fakediscuit.FakeDiscuit(numPosts = 300, maxComments = 20)
+  discuitstats.Config(
+    baseURL = server.start(), fromDate = "20260524", toDate = "20260531",
+    reportFileName = str(tmp_path / "report.md"), exportCSV = None,
+    archiveDir = None, rollupFile = None, checkpointFile = None,
+    spillFile = None, crawlStoreFile = None, metricsFile = None,
+    profileFile = None, maxRequestsPerSecond = None, daemonInterval = 0,
+    daemonDays = None).apply()
+  yield server
+  server.stop()
+  settings.apply()
+  if discuitstats.crawlStore:
+    discuitstats.crawlStore.close()
+    discuitstats.crawlStore = None
+
+# fetchFeed failing with a ConnectionError on its failAt-th call
+def failingFetchFeed(failAt):
+  fetchFeed = discuitstats.fetchFeed
+  calls = [0]
+  def fetch(*args, **kwargs):
+    calls[0] += 1
+    if calls[0] == failAt:
+      raise requests.ConnectionError("injected failure")
+    return fetchFeed(*args, **kwargs)
+  return fetch
+
+# a run failing mid-crawl with spilled rows leaves the spillFile usable, and
+# the daemon's next run completes
+def testDaemonRunsAgainAfterFailedRun(fake, tmp_path, monkeypatch, capsys):
+  discuitstats.spillFile = str(tmp_path / "spill.sqlite")
+  monkeypatch.setattr(discuitstats, "fetchFeed", failingFetchFeed(3))
+  discuitstats.runDaemon(runs = 2)
+  output = capsys.readouterr().out
+  assert output.count("Run failed") == 1
+  assert "injected failure" in output
+  with open(discuitstats.reportFileName) as report:
+    assert report.read()
+
+# the rows of a crawl, closing its records
+def crawlRows(resume = False):
+  records = discuitstats.crawlRecords("", resume)
+  rawData = records.toDataFrame()
+  records.close()
+  return rawData.sort_index().astype(str)
+
+# a crawl failing after a few feed pages, or once the rescan has started,
+# resumes from its checkpoint journal in that phase to the same rows as an
+# uninterrupted crawl, in memory and spilled
+@pytest.mark.parametrize("spill", [False, True])
+@pytest.mark.parametrize("phase", ["main", "rescan"])
+def testResumedCrawlMatchesUninterrupted(fake, tmp_path, monkeypatch, capsys, spill, phase):
+  discuitstats.checkpointFile = str(tmp_path / "crawl.journal")
+  discuitstats.checkpointEvery = 1
+  if spill:
+    discuitstats.spillFile = str(tmp_path / "spill.sqlite")
+  discuitstats.metrics = discuitstats.CrawlMetrics()
+  expected = crawlRows()
+  mainPages = discuitstats.metrics.summary()["counters"]["mainFeedPages"]
+  with monkeypatch.context() as patch:
+    patch.setattr(discuitstats, "fetchFeed", failingFetchFeed(
+      3 if phase == "main" else mainPages + 1))
+    with pytest.raises(requests.ConnectionError):
+      crawlRows()
+  capsys.readouterr()
+  rawData = crawlRows(resume = True)
+  assert f"Resuming crawl in the {phase} phase" in capsys.readouterr().out
+  assert rawData.equals(expected)
+
+# posts created after toDate have their comment download skipped, and each
+# is counted once whether or not comments are prefetched
+def testSkippedCommentFetchesCountedOnce(fake):
+  # the fake's posts go up to the day after its toDate
+  discuitstats.Config(fromDate = "20260520", toDate = "20260526").apply()
+  skipped = []
+  for fetchWorkers in (1, 4):
+    discuitstats.Config(fetchWorkers = fetchWorkers).apply()
+    discuitstats.metrics = discuitstats.CrawlMetrics()
+    crawlRows()
+    skipped.append(discuitstats.metrics.summary()["counters"].get("commentFetchesSkipped"))
+  assert skipped[0] and skipped[0] == skipped[1]
+
+# after a crawl rolled up, a range without any rolled-up days reports
+# nothing instead of failing, and --range (runRange) says so
+def testRollupRangeWithoutData(fake, tmp_path, capsys):
+  discuitstats.rollupFile = str(tmp_path / "rollups.sqlite")
+  discuitstats.run()
+  rollups = discuitstats.DailyRollups(discuitstats.rollupFile)
+  assert rollups.days() == (20260524, 20260531)
+  discuitstats.Config(fromDate = "20250101", toDate = "20250107").apply()
+  engine = discuitstats.RollupReport(rollups)
+  assert engine.numPosts == 0
+  engine.report(None)
+  capsys.readouterr()
+  discuitstats.runRange()
+  assert "none of 20250101-20250107" in capsys.readouterr().out
+
+# a sharded crawl spilled to disk, through a SpillStore per shard, collects
+# the rows of the in-memory one and removes the shards' files
+def testShardedSpillMatchesInMemory(fake, tmp_path):
+  discuitstats.shardWorkers = 4
+  expected = crawlRows()
+  discuitstats.spillFile = str(tmp_path / "spill.sqlite")
+  assert crawlRows().equals(expected)
+  assert [path.name for path in tmp_path.iterdir()] == ["spill.sqlite"]
+
+# a daemon given its number of runs waits out the interval between them,
+# but not after the last one
+def testDaemonReturnsAfterLastRun(fake, monkeypatch):
+  discuitstats.daemonInterval = 3600
+  sleeps = []
+  monkeypatch.setattr(discuitstats.time, "sleep", sleeps.append)
+  discuitstats.runDaemon(runs = 2)
+  assert len([seconds for seconds in sleeps if seconds > 60]) == 1